@@ -0,0 +1,151 @@
+"""
+@file: bench_import_time.py
+@date: 18/10/2026
+
+Import-time benchmark of the Lambda modules, the part of a cold start the code controls.
+
+Every module is imported in a fresh interpreter under `python -X importtime`, --repeat times. The
+report shows the median cumulative import time, the heavy dependencies the import pulls in (pandas,
+numpy, pyarrow, boto3, pymysql, bs4, ...) and the slowest direct imports. The results are compared
+with the stored baseline; a module that got slower by more than the tolerance, or that now loads a
+heavy dependency it did not load before, fails the run with exit code 1.
+
+Usage:
+    python benchmarks/bench_import_time.py                       # compare with the baseline
+    python benchmarks/bench_import_time.py --update-baseline     # store this run as the new baseline
+    python benchmarks/bench_import_time.py --modules loadingScript_DWH --top 15
+
+Baselines are machine specific, record them on the machine that runs the comparison.
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "import_time.json"
+
+# Lambda handlers first, then the shared modules they import
+DEFAULT_MODULES = ["lambda_function_with_units", "loadingScript_DWH", "CommodityTableCreator", "connections",
+                   "bulk_writer", "rate_store", "aggregates", "latest_index", "metrics", "http_cache"]
+HEAVY_PACKAGES = ["pandas", "numpy", "pyarrow", "boto3", "botocore", "pymysql", "bs4", "lxml", "requests",
+                  "selenium", "scipy"]
+
+# e.g. "import time:       750 |     437141 |   pandas"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile(module: str) -> list[tuple[int, int, str]]:
+    """
+    Imports a module in a fresh interpreter with -X importtime.
+
+    :param module: Module name, imported from src/.
+    :return: (depth, cumulative microseconds, name) per imported module, in import order.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC_DIR,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{process.stderr[-2000:]}")
+    entries = []
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            # Nested imports are indented by two spaces per level
+            entries.append((len(match.group(3)) // 2, int(match.group(2)), match.group(4)))
+    return entries
+
+
+def measure(module: str, repeat: int, top: int) -> dict:
+    """
+    Measures the import of a module --repeat times.
+
+    :return: Result dict with the median cumulative milliseconds, the heavy packages loaded and the
+             slowest direct imports of the last run.
+    """
+    timings = []
+    for _ in range(repeat):
+        entries = import_profile(module)
+        total = next(cumulative for depth, cumulative, name in reversed(entries) if name == module and depth == 0)
+        timings.append(total)
+
+    # Children are printed before their parent: the module's own imports are the entries between the
+    # previous top-level import (interpreter startup) and the module itself
+    end = max(idx for idx, (depth, _, name) in enumerate(entries) if name == module and depth == 0)
+    start = max((idx for idx, (depth, _, _) in enumerate(entries[:end]) if depth == 0), default=-1) + 1
+    own = entries[start:end]
+    loaded = {name.split(".")[0] for _, _, name in own}
+    slowest = sorted(((cumulative, name) for depth, cumulative, name in own if depth == 1), reverse=True)[:top]
+    return {
+        "cumulative_ms": round(statistics.median(timings) / 1000, 2),
+        "heavy": sorted(package for package in HEAVY_PACKAGES if package in loaded),
+        "slowest_imports": {name: round(cumulative / 1000, 2) for cumulative, name in slowest},
+    }
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, min_delta_ms: float) -> list[str]:
+    """
+    Compares the results with the baseline.
+
+    :return: One message per regression, empty if there is none.
+    """
+    regressions = []
+    for module, result in results.items():
+        base = baseline.get(module)
+        if base is None:
+            continue
+        if (result["cumulative_ms"] > base["cumulative_ms"] * (1 + time_tolerance)
+                and result["cumulative_ms"] - base["cumulative_ms"] > min_delta_ms):
+            regressions.append(f"{module}: {result['cumulative_ms']} ms, baseline {base['cumulative_ms']} ms")
+        new_heavy = sorted(set(result["heavy"]) - set(base["heavy"]))
+        if new_heavy:
+            regressions.append(f"{module}: now imports {', '.join(new_heavy)}")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict) -> None:
+    print(f"{'module':<30}{'import ms':>12}{'vs base':>10}  heavy dependencies")
+    for module, result in results.items():
+        base = baseline.get(module)
+        change = (f"{result['cumulative_ms'] / base['cumulative_ms'] - 1:+.0%}"
+                  if base and base["cumulative_ms"] else "new")
+        print(f"{module:<30}{result['cumulative_ms']:>12}{change:>10}  {', '.join(result['heavy']) or '-'}")
+        for name, milliseconds in result["slowest_imports"].items():
+            print(f"    {name:<34}{milliseconds:>10} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES), help="modules to import, comma separated")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=5, help="slowest direct imports shown per module")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="allowed slowdown, 0.5 = 50%%")
+    parser.add_argument("--min-delta-ms", type=float, default=20, help="smallest slowdown that can fail the run")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.repeat, args.top) for module in args.modules.split(",")}
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+        for message in regressions:
+            print(f"  REGRESSION {message}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline." if baseline else "\nNo baseline yet, run with --update-baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+@file: bench_nutrition_extraction.py
+@date: 18/10/2026
+
+Micro-benchmark of the nutrition page extraction.
+
+Compares the old per-cell extraction (one soup.find per product and field on an html.parser soup)
+with the single-pass id index of NutritionScraper.parse_page on saved fixture pages.
+
+Usage:
+    python benchmarks/bench_nutrition_extraction.py --record      # save the live A-Z pages as fixtures
+    python benchmarks/bench_nutrition_extraction.py               # run the benchmark on the fixtures
+
+Without recorded fixtures, synthetic pages with the same id layout are generated.
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from Extract_NutritionTable import (NUTRITION_FIELDS, NutritionScraper,  # noqa: E402
+                                    parse_numbers, url_nutritionTable)
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "nutrition"
+
+
+def synthetic_page(letter: str, n_products: int) -> bytes:
+    """
+    Generates a page with the same structure and ids as the nutrition table website.
+
+    :param letter: The letter used in the product names.
+    :param n_products: Number of products on the page.
+    :return: The HTML of the page.
+    """
+    rng = random.Random(letter)
+    rows = ['<tr>' + ''.join(f'<th class="cBlue">{field}</th>' for field, _ in NUTRITION_FIELDS) + '</tr>']
+    for idx in range(n_products):
+        base = f"ctl00_cphMain_ltvNutrition_ctrl{idx}_"
+        cells = ''.join(f'<td><span id="{base}{label}">{rng.choice(["", rng.randint(0, 900), "1,5"])}</span></td>'
+                        for _, label in NUTRITION_FIELDS)
+        rows.append(f'<tr><td><a class="prodNameLink" href="#">{letter} product {idx}</a></td>{cells}</tr>')
+    return f"<html><body><table>{''.join(rows)}</table></body></html>".encode()
+
+
+def load_pages(n_products: int) -> dict[str, bytes]:
+    """
+    Loads the recorded fixture pages, or generates synthetic ones if none were recorded.
+
+    :param n_products: Number of products per synthetic page.
+    :return: A dict mapping letter to page HTML.
+    """
+    recorded = sorted(FIXTURE_DIR.glob("*.html"))
+    if recorded:
+        return {path.stem: path.read_bytes() for path in recorded}
+    print(f"No fixtures in {FIXTURE_DIR}, using synthetic pages with {n_products} products each.")
+    return {letter: synthetic_page(letter, n_products) for letter in string.ascii_uppercase}
+
+
+def record_pages() -> None:
+    """
+    Downloads the live A-Z pages into the fixture directory.
+    """
+    FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+    scraper = NutritionScraper(url_nutritionTable)
+    for letter in string.ascii_uppercase:
+        response = scraper.fetch_page(letter)
+        if response is not None:
+            (FIXTURE_DIR / f"{letter}.html").write_bytes(response.content)
+            print(f"Recorded {letter}: {len(response.content)} bytes")
+
+
+def legacy_parse(content: bytes) -> pd.DataFrame:
+    """
+    The previous extraction: html.parser soup and one document search per product and field.
+
+    :param content: The raw HTML of the page.
+    :return: A DataFrame containing the nutrition data of the page.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    product_names = [element.get_text().strip() for element in soup.find_all(class_="prodNameLink")]
+    df = pd.DataFrame([[None] * len(NUTRITION_FIELDS)] * len(product_names),
+                      columns=[field for field, _ in NUTRITION_FIELDS])
+    df.insert(0, 'Product Name', product_names)
+    for idx in range(len(df)):
+        for field, label in NUTRITION_FIELDS:
+            df.at[idx, field] = NutritionScraper.extract_value(soup, f"ctl00_cphMain_ltvNutrition_ctrl{idx}_", label)
+    return df
+
+
+def time_parser(parse, pages: dict[str, bytes], repeat: int) -> tuple[float, list[pd.DataFrame]]:
+    """
+    Runs a parser over all pages and returns the best total time of several runs.
+
+    :param parse: Callable taking (content, letter) and returning a DataFrame.
+    :param pages: A dict mapping letter to page HTML.
+    :param repeat: Number of runs.
+    :return: The best total time in seconds and the DataFrames of the last run.
+    """
+    best = float("inf")
+    dfs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dfs = [parse(content, letter) for letter, content in pages.items()]
+        best = min(best, time.perf_counter() - start)
+    return best, dfs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="record the live pages as fixtures")
+    parser.add_argument("--products", type=int, default=100, help="products per synthetic page")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per parser, the best one is reported")
+    args = parser.parse_args()
+
+    if args.record:
+        record_pages()
+        return
+
+    pages = load_pages(args.products)
+    scraper = NutritionScraper(url_nutritionTable)
+
+    legacy_time, legacy_dfs = time_parser(lambda content, letter: legacy_parse(content), pages, args.repeat)
+    new_time, new_dfs = time_parser(scraper.parse_page, pages, args.repeat)
+
+    # Both extractions must produce the same table, the new one already typed
+    for legacy_df, new_df in zip(legacy_dfs, new_dfs):
+        for field, _ in NUTRITION_FIELDS:
+            legacy_df[field] = parse_numbers(legacy_df[field])
+        pd.testing.assert_frame_equal(legacy_df, new_df, check_dtype=False)
+
+    rows = sum(len(df) for df in new_dfs)
+    print(f"Pages: {len(pages)}, products: {rows}")
+    print(f"per-cell soup.find : {legacy_time:8.3f} s")
+    print(f"single-pass index  : {new_time:8.3f} s")
+    print(f"speedup            : {legacy_time / new_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
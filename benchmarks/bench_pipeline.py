@@ -0,0 +1,406 @@
+"""
+@file: bench_pipeline.py
+@date: 18/10/2026
+
+Offline end-to-end benchmark of the pipeline stages.
+
+Nothing leaves the machine: the scrapers read recorded (or synthetic) pages from a local HTTP server,
+S3 is a moto server unless S3_ENDPOINT_URL points at another S3-compatible stand-in (e.g. MinIO),
+and the insert stage runs against the MySQL-compatible database given by DB_HOST/DB_USER/DB_PASS,
+e.g. a local MariaDB container. Without DB_HOST the insert stage is skipped.
+
+Stages:
+    scrape_nutrition    NutritionScraper over the A-Z pages
+    scrape_commodities  scrape_commodity_tables on the commodities page
+    random_meals        get_unique_meals against a local meal catalog
+    upload              Parquet serialization, S3 upload and latest.json pointer, per snapshot size
+    get_latest          get_latest_csv, per snapshot size
+    convert             currency cleaning and as-of USD conversion, per snapshot size
+    insert              bulk_writer.write_rows with LOAD_STRATEGY, per snapshot size
+
+Every stage is timed --repeat times (p50/p95 latency, rows per second at p50) and run once more under
+tracemalloc for its peak memory. The results are compared with the stored baseline; a stage slower or
+hungrier than the baseline by more than the tolerance fails the run with exit code 1.
+
+Usage:
+    python benchmarks/bench_pipeline.py                        # all sizes, compare with the baseline
+    python benchmarks/bench_pipeline.py --sizes 100,10000      # selected snapshot sizes
+    python benchmarks/bench_pipeline.py --update-baseline      # store this run as the new baseline
+
+Baselines are machine specific, record them on the machine that runs the comparison.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import bulk_writer  # noqa: E402
+import connections  # noqa: E402
+import latest_index  # noqa: E402
+import lambda_function_with_units  # noqa: E402
+import loadingScript_DWH  # noqa: E402
+import rate_store  # noqa: E402
+import raw_schema  # noqa: E402
+import RandomMeal  # noqa: E402
+from bench_nutrition_extraction import load_pages  # noqa: E402
+from Extract_NutritionTable import NutritionScraper  # noqa: E402
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "http"
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "pipeline.json"
+
+DEFAULT_SIZES = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+CURRENCIES = ["USD", "EUR", "CHF", "GBP", "JPY", "USd", "BRL"]
+UNITS = ["Bu", "T", "Lbs", "MT", "Kg"]
+
+BENCH_COMMODITY_BUCKET = "bench-commodity"
+BENCH_EXCHANGE_BUCKET = "bench-exchange"
+SNAPSHOT_DATE = "2000-01-01"
+
+
+def synthetic_commodities(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generates a commodity snapshot with the columns and value mix of the scraper output.
+
+    :param n_rows: Number of rows.
+    :param seed: Seed of the random generator.
+    :return: DataFrame with category, name, price, currency and unit.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "category": rng.choice(["Agricultural", "Livestock"], n_rows),
+        "name": [f"Good {idx}" for idx in range(n_rows)],
+        "price": rng.uniform(0.1, 5000, n_rows).round(2),
+        "currency": rng.choice(CURRENCIES, n_rows),
+        "unit": rng.choice(UNITS, n_rows),
+    })
+
+
+def synthetic_commodities_page(n_rows: int) -> bytes:
+    """
+    Generates a commodities page with the table layout parse_commodity_tables expects.
+    """
+    df = synthetic_commodities(n_rows)
+    tables = []
+    for category, group in df.groupby("category"):
+        rows = "".join(
+            f'<tr data-symbol="S{idx}:COM"><td class="datatable-item-first"><b>{row.name}</b>'
+            f'<div>{row.currency}/{row.unit}</div></td><td id="p">{row.price:,.2f}</td></tr>'
+            for idx, row in enumerate(group.itertuples())
+        )
+        tables.append(f'<table class="table table-hover"><thead><tr><th>{category}</th></tr></thead>'
+                      f'<tbody>{rows}</tbody></table>')
+    return f"<html><body>{''.join(tables)}</body></html>".encode()
+
+
+def synthetic_meals(n_meals: int) -> list[dict]:
+    rng = random.Random(n_meals)
+    meals = []
+    for idx in range(n_meals):
+        meal = {"idMeal": str(50000 + idx), "strMeal": f"Meal {idx}", "strCategory": rng.choice(["Beef", "Vegan"])}
+        for number in range(1, 21):
+            meal[f"strIngredient{number}"] = rng.choice(["Salt", "Rice", "Milk", ""])
+            meal[f"strMeasure{number}"] = rng.choice(["1 tsp", "200g", ""])
+        meals.append(meal)
+    return meals
+
+
+class FixtureServer:
+    """
+    Local HTTP stand-in for the scraped websites.
+
+    Recorded pages in fixtures/http (commodities.html, meals.json) and fixtures/nutrition (A.html ...)
+    are served when present, synthetic ones otherwise.
+    """
+
+    def __init__(self, nutrition_products: int, commodity_rows: int, meals: int):
+        commodities_path = FIXTURE_DIR / "commodities.html"
+        meals_path = FIXTURE_DIR / "meals.json"
+        self.nutrition_pages = load_pages(nutrition_products)
+        self.commodities_page = (commodities_path.read_bytes() if commodities_path.exists()
+                                 else synthetic_commodities_page(commodity_rows))
+        self.meals = json.loads(meals_path.read_text()) if meals_path.exists() else synthetic_meals(meals)
+        self.reset()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def reset(self):
+        # The random endpoint serves the same sequence in every run, so the early stop is reproducible
+        self.meal_picker = random.Random(0)
+        self.meal_lock = threading.Lock()
+
+    def random_meal(self) -> dict:
+        with self.meal_lock:
+            return self.meal_picker.choice(self.meals)
+
+    def handler_class(self):
+        fixtures = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path.startswith("/nutritions/"):
+                    body = fixtures.nutrition_pages.get(path.strip("/").split("/")[-1])
+                elif path == "/commodities":
+                    body = fixtures.commodities_page
+                elif path.endswith("/random.php"):
+                    body = json.dumps({"meals": [fixtures.random_meal()]}).encode()
+                else:
+                    body = None
+                self.send_response(200 if body is not None else 404)
+                self.send_header("Content-Length", str(len(body or b"")))
+                self.end_headers()
+                self.wfile.write(body or b"")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def start_s3_stand_in():
+    """
+    Starts a moto S3 server unless S3_ENDPOINT_URL already points at a stand-in.
+
+    :return: The moto server to stop at the end, or None.
+    """
+    if os.environ.get("S3_ENDPOINT_URL"):
+        return None
+    from moto.server import ThreadedMotoServer
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    os.environ["S3_ENDPOINT_URL"] = f"http://127.0.0.1:{port}"
+    for name, value in (("AWS_ACCESS_KEY_ID", "bench"), ("AWS_SECRET_ACCESS_KEY", "bench"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        os.environ.setdefault(name, value)
+    return server
+
+
+def measure(run, rows: int, repeat: int, setup=None) -> dict:
+    """
+    Times a stage and measures its peak memory in a separate run, tracemalloc slows code down.
+
+    :param run: Callable running the stage once, its return value is passed on to the next setup.
+    :param rows: Rows processed by one run, for rows per second.
+    :param repeat: Number of timed runs.
+    :param setup: Optional callable run untimed before every run, its result is passed to run.
+    :return: Result dict with rows, p50/p95 in milliseconds, rows per second and peak MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        run(arg) if setup else run()
+        timings.append(time.perf_counter() - start)
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    run(arg) if setup else run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    p50, p95 = np.percentile(timings, [50, 95])
+    return {"rows": rows, "p50_ms": round(p50 * 1000, 2), "p95_ms": round(p95 * 1000, 2),
+            "rows_per_second": round(rows / p50, 1) if p50 else None, "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def fresh_http_cache(server: FixtureServer) -> None:
+    # Every run starts with an empty HTTP cache, so the stand-in is actually requested
+    os.environ["HTTP_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_http_")
+    server.reset()
+
+
+def bench_scrapers(server: FixtureServer, repeat: int) -> dict:
+    results = {}
+    lambda_function_with_units.COMMODITIES_URL = server.url + "/commodities"
+    RandomMeal.RANDOM_MEAL_URL = server.url + "/api/json/v1/1/random.php"
+
+    def scrape_nutrition(_):
+        scraper = NutritionScraper(server.url + "/nutritions/", requests_per_second=None)
+        return sum(len(df) for df in scraper.iter_letters())
+
+    rows = scrape_nutrition(fresh_http_cache(server))
+    results["scrape_nutrition"] = measure(scrape_nutrition, rows, repeat, setup=lambda: fresh_http_cache(server))
+
+    def scrape_commodities(_):
+        tables = lambda_function_with_units.scrape_commodity_tables()
+        return sum(len(records) for records in tables.values())
+
+    rows = scrape_commodities(fresh_http_cache(server))
+    results["scrape_commodities"] = measure(scrape_commodities, rows, repeat, setup=lambda: fresh_http_cache(server))
+
+    def random_meals(_):
+        return len(RandomMeal.get_unique_meals(n=4 * len(server.meals)))
+
+    rows = random_meals(fresh_http_cache(server))
+    results["random_meals"] = measure(random_meals, rows, repeat, setup=lambda: fresh_http_cache(server))
+    return results
+
+
+def prepare_buckets(s3) -> rate_store.RateStore:
+    for bucket in (BENCH_COMMODITY_BUCKET, BENCH_EXCHANGE_BUCKET):
+        try:
+            s3.create_bucket(Bucket=bucket)
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    # One exchange snapshot valid for the benchmark date
+    rates = pd.DataFrame({"Currency": CURRENCIES[1:], "ExchangeRate": [0.9, 0.88, 0.79, 150.0, 100.0, 5.1]})
+    s3.put_object(Bucket=BENCH_EXCHANGE_BUCKET, Key=f"exchange_rates/rates_{SNAPSHOT_DATE}.csv",
+                  Body=rates.to_csv(index=False).encode())
+    store = rate_store.RateStore(os.path.join(tempfile.mkdtemp(prefix="bench_rates_"), "rates.parquet"))
+    store.refresh(s3, BENCH_EXCHANGE_BUCKET, "exchange_rates/")
+    return store
+
+
+def bench_size(s3, store: rate_store.RateStore, conn, n_rows: int, repeat: int) -> dict:
+    results = {}
+    df = synthetic_commodities(n_rows)
+    key = latest_index.partition_prefix(pd.Timestamp(SNAPSHOT_DATE)) + f"commodity_data_{SNAPSHOT_DATE}_06-00-00.parquet"
+
+    def upload():
+        body = raw_schema.to_parquet_bytes(df, raw_schema.COMMODITY_SCHEMA)
+        s3.put_object(Bucket=BENCH_COMMODITY_BUCKET, Key=key, Body=body)
+        latest_index.write_pointer(s3, BENCH_COMMODITY_BUCKET, key, body, len(df))
+
+    results["upload"] = measure(upload, n_rows, repeat)
+
+    results["get_latest"] = measure(
+        lambda: loadingScript_DWH.get_latest_csv(BENCH_COMMODITY_BUCKET, columns=loadingScript_DWH.COMMODITY_COLUMNS),
+        n_rows, repeat)
+
+    raw_df, _ = loadingScript_DWH.get_latest_csv(BENCH_COMMODITY_BUCKET, columns=loadingScript_DWH.COMMODITY_COLUMNS)
+    results["convert"] = measure(lambda frame: loadingScript_DWH.prepare_commodities(frame, key, store),
+                                 n_rows, repeat, setup=raw_df.copy)
+
+    if conn is not None:
+        converted_df = loadingScript_DWH.prepare_commodities(raw_df.copy(), key, store)[0]
+        strategy = bulk_writer.get_strategy()
+
+        def clear_snapshot():
+            # The benchmark date is emptied before every run and at the end
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM commodity_prices_usd WHERE timestamp = %s", (SNAPSHOT_DATE,))
+            conn.commit()
+
+        results["insert"] = measure(lambda _: bulk_writer.write_rows(conn, converted_df, strategy=strategy),
+                                    n_rows, repeat, setup=clear_snapshot)
+        clear_snapshot()
+    return results
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float,
+            min_delta_ms: float) -> list[str]:
+    """
+    Compares the results with the baseline.
+
+    Differences below min_delta_ms (or 1 MB) are ignored, the smallest stages mostly measure noise.
+
+    :return: One message per regression, empty if there is none.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if (result["p50_ms"] > base["p50_ms"] * (1 + time_tolerance)
+                and result["p50_ms"] - base["p50_ms"] > min_delta_ms):
+            regressions.append(f"{name}: p50 {result['p50_ms']} ms, baseline {base['p50_ms']} ms")
+        if result["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) and result["peak_mb"] - base["peak_mb"] > 1:
+            regressions.append(f"{name}: peak {result['peak_mb']} MB, baseline {base['peak_mb']} MB")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict) -> None:
+    print(f"{'stage':<28}{'rows':>10}{'p50 ms':>12}{'p95 ms':>12}{'rows/s':>14}{'peak MB':>10}{'vs base':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = f"{result['p50_ms'] / base['p50_ms'] - 1:+.0%}" if base and base["p50_ms"] else "new"
+        print(f"{name:<28}{result['rows']:>10}{result['p50_ms']:>12}{result['p95_ms']:>12}"
+              f"{result['rows_per_second'] or '-':>14}{result['peak_mb']:>10}{change:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="snapshot sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage")
+    parser.add_argument("--skip-scrapers", action="store_true", help="only run the S3 and database stages")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.3, help="allowed p50 slowdown, 0.3 = 30%%")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="allowed peak memory growth")
+    parser.add_argument("--min-delta-ms", type=float, default=10, help="smallest p50 slowdown that can fail the run")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    moto_server = start_s3_stand_in()
+    try:
+        results = {}
+        if not args.skip_scrapers:
+            with FixtureServer(nutrition_products=100, commodity_rows=200, meals=300) as server:
+                results.update(bench_scrapers(server, args.repeat))
+
+        s3 = connections.get_s3_client()
+        store = prepare_buckets(s3)
+        conn = None
+        if os.environ.get("DB_HOST"):
+            import schema_migrations
+            conn = connections.get_connection(connect_timeout=10, local_infile=bulk_writer.get_strategy() == "load_data")
+            schema_migrations.migrate(conn)
+        else:
+            print("DB_HOST not set, skipping the insert stage.")
+
+        for n_rows in sizes:
+            for stage, result in bench_size(s3, store, conn, n_rows, args.repeat).items():
+                results[f"{stage}/{n_rows}"] = result
+    finally:
+        if moto_server is not None:
+            moto_server.stop()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+        for message in regressions:
+            print(f"  REGRESSION {message}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline." if baseline else "\nNo baseline yet, run with --update-baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+@file: bench_product_matcher.py
+@date: 18/10/2026
+
+Benchmark of the product to trading good matching over the full nutrition table.
+
+Compares a brute-force comparison (the same trigram score computed in Python for every product name
+and every goods phrase) with the precompiled index of ProductMatcher, cold and with a warm disk cache.
+Both must find the same goods.
+
+Usage:
+    python benchmarks/bench_product_matcher.py --csv nutritionTable.csv    # a scraped nutrition table
+    python benchmarks/bench_product_matcher.py                             # recorded fixture pages
+
+Without a table or recorded fixture pages, synthetic product names are generated.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from Extract_NutritionTable import NutritionScraper, url_nutritionTable  # noqa: E402
+from product_matcher import (CONTAINMENT_WEIGHT, DICE_WEIGHT, ProductMatcher, normalize,  # noqa: E402
+                             trigrams)
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "nutrition"
+
+WORDS = ["whole", "milk", "cheese", "gouda", "dark", "chocolate", "oat", "flakes", "rice", "cakes", "chicken",
+         "breast", "apple", "banana", "peanut", "butter", "sweet", "potato", "orange", "juice", "beef", "steak",
+         "salmon", "smoked", "tofu", "bread", "rye", "honey", "tomato", "sauce", "corn", "coffee", "tea", "green"]
+
+
+def synthetic_names(n_names: int) -> list[str]:
+    rng = random.Random(0)
+    return [" ".join(rng.sample(WORDS, rng.randint(1, 4))).title() + f" {idx}" for idx in range(n_names)]
+
+
+def load_names(csv_path: Path, n_names: int) -> list[str]:
+    """
+    Loads the product names of a nutrition table CSV, of the recorded fixture pages or synthetic ones.
+
+    :param csv_path: Nutrition table written by Extract_NutritionTable.py, may be None.
+    :param n_names: Number of synthetic names.
+    :return: The product names.
+    """
+    if csv_path is not None:
+        return pd.read_csv(csv_path, sep=';')['Product Name'].astype(str).tolist()
+    recorded = sorted(FIXTURE_DIR.glob("*.html"))
+    if recorded:
+        scraper = NutritionScraper(url_nutritionTable)
+        return [name for path in recorded for name in scraper.parse_page(path.read_bytes(), path.stem)['Product Name']]
+    print(f"No table and no fixtures in {FIXTURE_DIR}, using {n_names} synthetic product names.")
+    return synthetic_names(n_names)
+
+
+def brute_force(names: list[str], matcher: ProductMatcher) -> list:
+    """
+    The quadratic approach: every name against every phrase one pair at a time, best score wins.
+    """
+    phrase_grams = [trigrams(phrase) for phrase in matcher.phrases]
+    matches = []
+    for name in names:
+        grams = trigrams(normalize(name))
+        scores = []
+        for phrase in phrase_grams:
+            shared = len(grams & phrase)
+            scores.append(CONTAINMENT_WEIGHT * shared / len(phrase) + DICE_WEIGHT * 2 * shared / (len(grams) + len(phrase)))
+        best = max(range(len(scores)), key=scores.__getitem__)
+        matches.append(matcher.phrase_goods[best] if scores[best] >= matcher.min_confidence else None)
+    return matches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", type=Path, help="nutrition table CSV as written by Extract_NutritionTable.py")
+    parser.add_argument("--names", type=int, default=5000, help="synthetic product names")
+    args = parser.parse_args()
+
+    names = load_names(args.csv, args.names)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = str(Path(tmp_dir) / "product_matches.json")
+
+        start = time.perf_counter()
+        matcher = ProductMatcher(cache_path=cache_path)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        brute_matches = brute_force(names, matcher)
+        brute_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = matcher.match_many(names)
+        cold_time = time.perf_counter() - start
+
+        # A new matcher, as on the next refresh: every name comes from the disk cache
+        start = time.perf_counter()
+        ProductMatcher(cache_path=cache_path).match_many(names)
+        warm_time = time.perf_counter() - start
+
+    matched = result['trading_goods_name'].notna().sum()
+    agree = sum(a == b for a, b in zip(brute_matches, result['trading_goods_name'].tolist()))
+    print(f"{len(names)} product names, {len(matcher.phrases)} goods phrases, {matched} matched")
+    print(f"compile index:       {compile_time * 1000:8.1f} ms")
+    print(f"brute force:         {brute_time * 1000:8.1f} ms")
+    print(f"trigram index cold:  {cold_time * 1000:8.1f} ms ({brute_time / cold_time:.1f}x faster)")
+    print(f"trigram index warm:  {warm_time * 1000:8.1f} ms (disk cache)")
+    print(f"same good as brute force for {agree / len(names):.1%} of the names")
+
+
+if __name__ == "__main__":
+    main()
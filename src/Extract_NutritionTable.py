@@ -5,15 +5,26 @@
 """
 
 # all imports
+import argparse
+import hashlib
+import json
+import os
+import re
 import string
+import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, Optional
+from urllib.parse import urlparse
 
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from requests.adapters import HTTPAdapter
+
+import raw_schema
+from http_cache import CachedResponse, HttpCache
 
 # specific pandas df
 pd.set_option('display.max_rows', 50)
@@ -23,17 +34,154 @@ pd.set_option('display.precision', 2)
 # define url 
 url_nutritionTable = "https://www.nutritiontable.com/nutritions/"
 
+# parser backend, lxml is considerably faster than the built-in html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# nutrition value spans have ids like ctl00_cphMain_ltvNutrition_ctrl{idx}_{label}
+NUTRITION_ID_PATTERN = re.compile(r"^ctl00_cphMain_ltvNutrition_ctrl(\d+)_(lbl\w+)$")
+NUTRITION_FIELDS = [('kcal', 'lblKcal'), ('kJoule', 'lblKjoule'), ('water', 'lblWater'),
+                    ('protein', 'lblEiwit'), ('carbohydrat', 'lblKoolh'), ('sugars', 'lblSuikers'),
+                    ('fat', 'lblVet'), ('saturated_fat', 'lblVerz'), ('monounsat', 'lblEov'),
+                    ('polyunsat', 'lblMov'), ('cholesterol', 'lblChol'), ('dietary_fiber', 'lblVoedv'),
+                    ('emotional_value', 'lblFeeling'), ('health_value', 'lblHealty')]
+LABEL_TO_FIELD = {label: field for field, label in NUTRITION_FIELDS}
+
+def parse_numbers(values: pd.Series) -> pd.Series:
+    """
+    Parses nutrition values to float, independent of the decimal separator.
+
+    With both separators present the last one is the decimal point ("1.234,5", "1,234.5"),
+    a lone comma is a decimal comma ("1,5"), the integer part may be missing (".5"). Prefixes like
+    "<" or "~" and units are ignored, values without a number become NaN.
+
+    :param values: Series of strings or None.
+    :return: A float64 Series.
+    """
+    text = values.astype('string').str.replace('[\\s\u00a0]', '', regex=True)
+    comma_decimal = text.str.rfind(',') > text.str.rfind('.')
+    text = text.where(~comma_decimal, text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    text = text.str.replace(',', '', regex=False)
+    number = text.str.extract(r'([-+]?\d*\.?\d+)', expand=False)
+    return pd.to_numeric(number, errors='coerce').astype('float64')
+
+
+# crawl settings
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 4.0
+
+
+# spacing of requests to the same host
+class HostRateLimiter:
+    def __init__(self, requests_per_second: Optional[float]):
+        """
+        Initializes the rate limiter.
+
+        :param requests_per_second: Maximum number of requests started per second and host,
+                                    None or 0 disables the limit.
+        """
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_slot: dict[str, float] = {}  # host -> earliest start time of the next request
+
+    def wait(self, url: str) -> None:
+        """
+        Blocks until a request to the host of the given URL may be started.
+
+        :param url: The URL that is about to be requested.
+        """
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# per-letter state of the incremental refresh
+class CheckpointStore:
+    def __init__(self, path: str):
+        """
+        Loads the checkpoint file, or starts empty if there is none yet.
+
+        The file holds the content hash, row count and timestamp of every letter, plus the letters
+        already done by an unfinished run so that a crashed refresh can resume after them.
+
+        :param path: Path of the JSON checkpoint file.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {'letters': {}, 'run': None}
+
+    def get(self, letter: str) -> Optional[dict]:
+        return self.state['letters'].get(letter)
+
+    def start_run(self) -> dict:
+        """
+        Starts a new run, or returns the unfinished one to resume it.
+
+        :return: The run dict with its id and the letters already completed.
+        """
+        with self.lock:
+            if self.state['run'] is None:
+                self.state['run'] = {'id': datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S'), 'completed': []}
+                self.save()
+            return self.state['run']
+
+    def complete_letter(self, letter: str, content_hash: str, rows: int) -> None:
+        with self.lock:
+            self.state['letters'][letter] = {'hash': content_hash, 'rows': rows,
+                                             'updated_at': datetime.utcnow().isoformat(timespec='seconds')}
+            self.state['run']['completed'].append(letter)
+            self.save()
+
+    def finish_run(self) -> None:
+        with self.lock:
+            self.state['run'] = None
+            self.save()
+
+    def save(self) -> None:
+        # Replace the file atomically, a crash never leaves a half-written checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
 # scraping function for main nutrition Values
 class NutritionScraper:
-    def __init__(self, url_base: str):
+    def __init__(self, url_base: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND):
         """
         Initializes the NutritionScraper with the base URL.
         
         :param url_base: The base URL of the nutrition table website.
+        :param max_workers: Number of letters fetched and parsed at the same time.
+        :param requests_per_second: Maximum request rate per host, None disables the limit.
         """
         self.url_base = url_base
+        self.max_workers = max_workers
         self.headers: Optional[list] = None
-        self.all_dfs: list[pd.DataFrame] = []  # List to store DataFrames for each letter
+
+        # One keep-alive session shared by all workers, the pool holds one connection per worker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+
+        # Pages go through the shared on-disk cache, only real network requests are rate limited
+        self.http = HttpCache(session=self.session, before_request=self.rate_limiter.wait)
 
     def extract_data_for_letter(self, letter: str) -> Optional[pd.DataFrame]:
         """
@@ -50,59 +198,79 @@ class NutritionScraper:
                 print(f"Skipping letter {letter} due to fetch error.")
                 return None
 
-            soup = BeautifulSoup(response.content, "html.parser")
+            return self.parse_page(response.content, letter)
 
-            # Extract headers if not already set
-            if not self.headers:
-                header_elements = soup.find_all(class_="cBlue")
-                if not header_elements:
-                    raise ValueError(f"No headers found for letter {letter}")
-
-                self.headers = ['Product Name'] + [element.get_text().strip() for element in header_elements]
-                # Ensure headers match the required 14 columns
-                self.headers = ['Product Name', 'kcal', 'kJoule', 'water', 'protein', 'carbohydrat', 'sugars',
-                                'fat', 'saturated_fat', 'monounsat', 'polyunsat', 'cholesterol',
-                                'dietary_fiber', 'emotional_value', 'health_value']
+        except Exception as e:
+            print(f"Error processing letter {letter}: {e}")
+            return None
 
-            # Extract product names using list comprehension
-            product_names = [element.get_text().strip() for element in soup.find_all(class_="prodNameLink")]
-            if not product_names:
-                print(f"Warning: No product names found for letter {letter}")
-                return None
+    def parse_page(self, content: bytes, letter: str) -> Optional[pd.DataFrame]:
+        """
+        Parses the HTML of a letter page into a DataFrame with one row per product.
 
-            # Create an empty DataFrame for this letter's data
-            df = pd.DataFrame([[None] * (len(self.headers) - 1)] * len(product_names), columns=self.headers[1:])
-            df.insert(0, 'Product Name', product_names)
+        The nutrition spans are collected in a single walk over the document and indexed by
+        (product index, label), so no per-cell search over the whole page is needed.
 
-            # Fill the DataFrame with nutritional values
-            base_id = lambda idx: f"ctl00_cphMain_ltvNutrition_ctrl{idx}_"
-            fields = [('kcal', 'lblKcal'), ('kJoule', 'lblKjoule'), ('water', 'lblWater'),
-                      ('protein', 'lblEiwit'), ('carbohydrat', 'lblKoolh'), ('sugars', 'lblSuikers'),
-                      ('fat', 'lblVet'), ('saturated_fat', 'lblVerz'), ('monounsat', 'lblEov'),
-                      ('polyunsat', 'lblMov'), ('cholesterol', 'lblChol'), ('dietary_fiber', 'lblVoedv'),
-                      ('emotional_value', 'lblFeeling'), ('health_value', 'lblHealty')]
+        :param content: The raw HTML of the page.
+        :param letter: The letter the page belongs to, used for messages.
+        :return: A DataFrame containing the nutrition data of the page, or None if it has no products.
+        """
+        soup = BeautifulSoup(content, HTML_PARSER)
 
-            # Populate the DataFrame by iterating over the products
-            for idx in range(len(df)):
-                get_value = lambda label: self.extract_value(soup, base_id(idx), label)
-                for field, label in fields:
-                    df.at[idx, field] = get_value(label)
+        # Extract headers if not already set
+        if not self.headers:
+            header_elements = soup.find_all(class_="cBlue")
+            if not header_elements:
+                raise ValueError(f"No headers found for letter {letter}")
 
-            return df
+            # Ensure headers match the required 14 columns
+            self.headers = ['Product Name'] + [field for field, _ in NUTRITION_FIELDS]
 
-        except Exception as e:
-            print(f"Error processing letter {letter}: {e}")
+        # Extract product names using list comprehension
+        product_names = [element.get_text().strip() for element in soup.find_all(class_="prodNameLink")]
+        if not product_names:
+            print(f"Warning: No product names found for letter {letter}")
             return None
 
-    def fetch_page(self, letter: str) -> Optional[requests.Response]:
+        # Fill one column array per field from the id index
+        columns = {field: [None] * len(product_names) for field, _ in NUTRITION_FIELDS}
+        for (idx, label), value in self.build_value_index(soup).items():
+            field = LABEL_TO_FIELD.get(label)
+            if field is not None and idx < len(product_names):
+                columns[field][idx] = value
+
+        # Convert every column to float once, missing values become NaN
+        data = {'Product Name': product_names}
+        data.update((field, parse_numbers(pd.Series(values, dtype=object))) for field, values in columns.items())
+        return pd.DataFrame(data, columns=self.headers)
+
+    @staticmethod
+    def build_value_index(soup: BeautifulSoup) -> dict[tuple[int, str], str]:
+        """
+        Collects the text of all nutrition value spans of a page in one pass.
+
+        :param soup: The BeautifulSoup object representing the parsed HTML of the page.
+        :return: A dict mapping (product index, label) to the non-empty text value of the span.
+        """
+        index = {}
+        for element in soup.find_all("span", id=NUTRITION_ID_PATTERN):
+            match = NUTRITION_ID_PATTERN.match(element["id"])
+            value = element.get_text().strip()
+            if value:  # Empty values stay None like in extract_value
+                index[(int(match.group(1)), match.group(2))] = value
+        return index
+
+    def fetch_page(self, letter: str, ttl: Optional[float] = None) -> Optional[CachedResponse]:
         """
         Fetches the page content for a given letter of the alphabet.
 
         :param letter: A single letter representing the section of the website to scrape.
+        :param ttl: Overrides the cache TTL of the site, 0 always revalidates with the server.
         :return: The Response object containing the page content, or None if there was an error.
         """
         try:
-            response = requests.get(self.url_base + letter + '/')
+            url = self.url_base + letter + '/'
+            response = self.http.get(url, source='nutritiontable', ttl=ttl)
             response.raise_for_status()  # Raise an exception for bad status codes
             return response
         except requests.RequestException as e:
@@ -131,29 +299,173 @@ class NutritionScraper:
             return None
 
     # main Function
-    def main(self) -> pd.DataFrame:
+    def iter_letters(self, concurrent: bool = True) -> Iterator[pd.DataFrame]:
+        """
+        Yields the DataFrame of every letter (A-Z) with products, in A-Z order.
+
+        In concurrent mode the letters are fetched and parsed by a bounded pool of worker threads,
+        so parsing one page overlaps with waiting for the others. Frames are handed out as soon as
+        they are ready, so callers can write them away instead of holding all letters in memory.
+
+        :param concurrent: Whether to crawl the letters with the worker pool or one after another.
+        :return: An iterator over the DataFrames of the letters.
+        """
+        letters = string.ascii_uppercase
+
+        # pool.map yields the results lazily but in the A-Z order of the input
+        if concurrent:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for df in pool.map(self.extract_data_for_letter, letters):
+                    if df is not None and not df.empty:
+                        yield df
+        else:
+            for letter in letters:
+                df = self.extract_data_for_letter(letter)
+                if df is not None and not df.empty:
+                    yield df
+
+    def write_letters(self, csv_path: str, parquet_path: Optional[str] = None, concurrent: bool = True) -> int:
+        """
+        Scrapes all letters and appends each one to the output files as soon as it is parsed.
+
+        :param csv_path: Path of the ;-separated CSV output.
+        :param parquet_path: Optional path of a typed Parquet copy.
+        :param concurrent: Whether to crawl the letters with the worker pool or one after another.
+        :return: The number of rows written.
+        """
+        total_items = 0
+        parquet_writer = raw_schema.parquet_writer(parquet_path, raw_schema.NUTRITION_SCHEMA) if parquet_path else None
+        try:
+            with open(csv_path, 'w', encoding='utf-8', newline='') as csv_file:
+                for df in self.iter_letters(concurrent):
+                    df.to_csv(csv_file, sep=';', index=False, header=total_items == 0)
+                    if parquet_writer is not None:
+                        parquet_writer.write_table(raw_schema.to_table(df, raw_schema.NUTRITION_SCHEMA))
+                    total_items += len(df)
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+
+        print(f"\nTotal count of food items: {total_items}\n")
+        return total_items
+
+    def refresh(self, state_dir: str, concurrent: bool = True) -> dict:
+        """
+        Incremental refresh: only letters whose page changed since the last run are parsed.
+
+        Every page is revalidated with the server, a cached copy would hide changes. Every letter is
+        checkpointed as soon as it is done, a crashed refresh resumes with the letters it had not
+        finished. A refresh that ran to the end closes its run, even with failed letters, so the next
+        one checks all letters again. The parsed rows of every letter are kept in state_dir/letters,
+        rows that are new or changed compared to the previous version are appended to a delta file
+        state_dir/delta_<run id>.csv.
+
+        :param state_dir: Directory holding the checkpoint, the letter files and the delta files.
+        :param concurrent: Whether to process the letters with the worker pool or one after another.
+        :return: Summary dict with the delta path (None without delta rows) and the changed,
+                 unchanged and failed letters.
+        """
+        os.makedirs(os.path.join(state_dir, 'letters'), exist_ok=True)
+        checkpoints = CheckpointStore(os.path.join(state_dir, 'checkpoint.json'))
+        run = checkpoints.start_run()
+        delta_path = os.path.join(state_dir, f"delta_{run['id']}.csv")
+        delta_lock = threading.Lock()
+        summary = {'run': run['id'], 'delta_path': delta_path, 'resumed': list(run['completed']),
+                   'changed': [], 'unchanged': [], 'failed': [], 'delta_rows': 0}
+
+        def refresh_letter(letter: str) -> None:
+            response = self.fetch_page(letter, ttl=0)
+            if not response:
+                summary['failed'].append(letter)
+                return
+
+            # Unchanged page, nothing to parse
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            letter_path = os.path.join(state_dir, 'letters', f'{letter}.parquet')
+            checkpoint = checkpoints.get(letter)
+            if checkpoint and checkpoint['hash'] == content_hash and os.path.exists(letter_path):
+                checkpoints.complete_letter(letter, content_hash, checkpoint['rows'])
+                summary['unchanged'].append(letter)
+                return
+
+            try:
+                df = self.parse_page(response.content, letter)
+            except Exception as e:
+                print(f"Error processing letter {letter}: {e}")
+                summary['failed'].append(letter)
+                return
+            if df is None:
+                df = pd.DataFrame({column: pd.Series(dtype='float64') for column in raw_schema.NUTRITION_SCHEMA.names})
+                df['Product Name'] = df['Product Name'].astype(object)
+
+            # Rows not present with identical values in the previous version of the letter
+            if os.path.exists(letter_path):
+                previous = pd.read_parquet(letter_path)
+                merged = df.merge(previous.drop_duplicates(), how='left', on=list(df.columns), indicator=True)
+                delta = df[(merged['_merge'] == 'left_only').to_numpy()]
+            else:
+                delta = df
+
+            with delta_lock:
+                if not delta.empty:
+                    delta.to_csv(delta_path, sep=';', index=False, mode='a', header=not os.path.exists(delta_path))
+                    summary['delta_rows'] += len(delta)
+                raw_schema.write_parquet(df, raw_schema.NUTRITION_SCHEMA, letter_path + '.tmp')
+                os.replace(letter_path + '.tmp', letter_path)
+            checkpoints.complete_letter(letter, content_hash, len(df))
+            summary['changed'].append(letter)
+
+        # Letters finished by a crashed run are not processed again
+        letters = [letter for letter in string.ascii_uppercase if letter not in run['completed']]
+        if concurrent:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(refresh_letter, letters))
+        else:
+            for letter in letters:
+                refresh_letter(letter)
+
+        # The run ended: failed letters are retried by the next refresh along with all others
+        if not os.path.exists(delta_path):
+            summary['delta_path'] = None
+        checkpoints.finish_run()
+
+        print(f"Refresh {run['id']}: {len(summary['changed'])} letters changed, "
+              f"{len(summary['unchanged'])} unchanged, {len(summary['failed'])} failed, "
+              f"{summary['delta_rows']} delta rows")
+        return summary
+
+    @staticmethod
+    def load_refreshed(state_dir: str) -> pd.DataFrame:
+        """
+        Combines the letter files of the incremental refresh into one DataFrame in A-Z order.
+
+        :param state_dir: The state directory used by refresh.
+        :return: A DataFrame containing all nutrition data.
+        """
+        paths = [os.path.join(state_dir, 'letters', f'{letter}.parquet') for letter in string.ascii_uppercase]
+        letter_dfs = [pd.read_parquet(path) for path in paths if os.path.exists(path)]
+        if not letter_dfs:
+            return pd.DataFrame()
+        return pd.concat(letter_dfs, ignore_index=True)
+
+    # main Function
+    def main(self, concurrent: bool = True) -> pd.DataFrame:
         """
         Extracts nutrition tables for all letters (A-Z) and combines them into a single DataFrame.
     
+        :param concurrent: Whether to crawl the letters with the worker pool or one after another.
         :return: A DataFrame containing all nutrition data, or an empty DataFrame if no data was found.
         """
         try:
-            if self.headers is None:
-                pass
-
-            # Loop through each letter and collect DataFrames
-            for letter in string.ascii_uppercase:
-                df = self.extract_data_for_letter(letter)
-                if df is not None and not df.empty:
-                    self.all_dfs.append(df)
+            letter_dfs = list(self.iter_letters(concurrent))
 
             # Validate that DataFrames were collected
-            if not self.all_dfs:
+            if not letter_dfs:
                 print("No dataframes collected.")
                 return pd.DataFrame()
 
             # Combine all DataFrames
-            combined_df = pd.concat(self.all_dfs, ignore_index=True)
+            combined_df = pd.concat(letter_dfs, ignore_index=True)
 
             # Print important statistics
             total_items = len(combined_df)
@@ -168,7 +480,21 @@ class NutritionScraper:
             return pd.DataFrame()
 
 # extract table nutrition
-NutritionScraper = NutritionScraper(url_nutritionTable)
-df_NutritionTable = NutritionScraper.main()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrape the nutrition table.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only parse letters that changed since the last run, resumes an interrupted run")
+    parser.add_argument('--state-dir', default='nutrition_state', help="checkpoint directory of --incremental")
+    args = parser.parse_args()
+
+    scraper = NutritionScraper(url_nutritionTable)
 
-df_NutritionTable.to_csv('nutritionTable.csv', sep=';', encoding='utf-8', index=False)
\ No newline at end of file
+    if args.incremental:
+        scraper.refresh(args.state_dir)
+        df_NutritionTable = scraper.load_refreshed(args.state_dir)
+        df_NutritionTable.to_csv('nutritionTable.csv', sep=';', encoding='utf-8', index=False)
+    else:
+        # CSV plus a typed Parquet copy for the raw layer, stored under its date partition
+        parquet_dir = os.path.join('nutrition', datetime.utcnow().strftime('%Y/%m/%d'))
+        os.makedirs(parquet_dir, exist_ok=True)
+        scraper.write_letters('nutritionTable.csv', os.path.join(parquet_dir, 'nutritionTable.parquet'))
@@ -1,45 +1,167 @@
+import asyncio
+import string
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+
+from http_cache import CacheMiss, HttpCache
+
+RANDOM_MEAL_URL = "https://www.themealdb.com/api/json/v1/1/random.php"
+SEARCH_BY_LETTER_URL = "https://www.themealdb.com/api/json/v1/1/search.php"
+
+# The API lists up to 20 ingredient/measure pairs per meal
+MAX_INGREDIENTS = 20
+
+
+def rename_meal_columns(df):
+    """
+    Renames the API columns: removes the "str" prefix if it exists.
+    """
+    return df.rename(columns=lambda x: x[3:] if x.startswith("str") else x)
 
 
 def get_random_meal():
     """
     Retrieves a random meal from TheMealDB API and returns the data as a pandas DataFrame.
     """
-    url = "https://www.themealdb.com/api/json/v1/1/random.php"
-    response = requests.get(url)
+    response = HttpCache().get(RANDOM_MEAL_URL, source="themealdb-random")
     response.raise_for_status()  # Raise an exception for HTTP errors
     data = response.json()
 
     # Convert the 'meals' list from the API response into a DataFrame
     df = pd.DataFrame(data.get("meals", []))
+    return rename_meal_columns(df)
+
+
+def create_session(pool_size):
+    """
+    Creates a keep-alive session whose connection pool fits the given number of workers.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+async def collect_unique_meals(max_requests=1000, concurrency=8, window=50, min_discovery_rate=0.05):
+    """
+    Calls the random endpoint with bounded concurrency and keeps every meal once, keyed by idMeal.
+
+    Collection stops early when fewer than min_discovery_rate of the last `window` requests
+    returned a meal that was not seen before, i.e. the catalog is close to saturated.
+
+    :return: Tuple of (dict idMeal -> meal dict, stats dict).
+    """
+    meals = {}
+    recent = deque(maxlen=window)  # True for every request that found a new meal
+    stats = {"requests": 0, "errors": 0, "stopped_early": False}
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
 
-    # Rename columns: remove the "str" prefix if it exists
-    df.rename(columns=lambda x: x[3:] if x.startswith("str") else x, inplace=True)
-    return df
+    def fetch(http):
+        response = http.get(RANDOM_MEAL_URL, source="themealdb-random")
+        response.raise_for_status()
+        return response.json().get("meals") or []
 
+    async def worker(http, executor):
+        while stats["requests"] < max_requests and not stop.is_set():
+            stats["requests"] += 1
+            try:
+                results = await loop.run_in_executor(executor, fetch, http)
+            except CacheMiss:
+                # Offline mode: random.php is never cached, every further request would fail the same way
+                stop.set()
+                raise
+            except (requests.RequestException, ValueError) as e:
+                stats["errors"] += 1
+                print(f"Error on request {stats['requests']}: {e}")
+                continue
 
-def get_unique_meals(n=1000):
+            # Deduplicate as results arrive, only plain dicts are kept
+            found_new = False
+            for meal in results:
+                if meal["idMeal"] not in meals:
+                    meals[meal["idMeal"]] = meal
+                    found_new = True
+            recent.append(found_new)
+
+            if len(recent) == window and sum(recent) / window < min_discovery_rate:
+                stats["stopped_early"] = True
+                stop.set()
+
+    with create_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        http = HttpCache(session=session)
+        await asyncio.gather(*(worker(http, executor) for _ in range(concurrency)))
+
+    stats["unique_meals"] = len(meals)
+    stats["requests_per_meal"] = round(stats["requests"] / len(meals), 2) if meals else None
+    return meals, stats
+
+
+def get_unique_meals(n=1000, concurrency=8, window=50, min_discovery_rate=0.05):
+    """
+    Retrieves random meals from the API up to n times, keeps each meal once,
+    and returns the unique meal data. Stops early once hardly any new meals show up.
+    """
+    meals, stats = asyncio.run(collect_unique_meals(n, concurrency, window, min_discovery_rate))
+    print(f"{stats['unique_meals']} unique meals from {stats['requests']} requests "
+          f"({stats['requests_per_meal']} requests per meal, stopped early: {stats['stopped_early']})")
+
+    # Build the DataFrame once from the collected dicts
+    return rename_meal_columns(pd.DataFrame(list(meals.values())))
+
+
+def get_meals_by_letter(http, letter):
     """
-    Retrieves random meals from the API n times, combines them into a DataFrame,
-    removes duplicates, and returns the unique meal data.
+    Retrieves all meals whose name starts with the given letter.
     """
-    all_meals = []
+    response = http.get(SEARCH_BY_LETTER_URL, source="themealdb", params={"f": letter})
+    response.raise_for_status()
+    return response.json().get("meals") or []
+
 
-    # Loop n times to collect the data
-    for i in range(n):
+def get_all_meals(concurrency=8):
+    """
+    Enumerates the complete meal catalog through the search-by-first-letter endpoint,
+    fetching the letters in parallel. Returns the same columns as get_random_meal.
+    """
+    def fetch(letter):
         try:
-            meal_df = get_random_meal()
-            all_meals.append(meal_df)
-        except Exception as e:
-            print(f"Error on iteration {i}: {e}")
+            return get_meals_by_letter(http, letter)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error fetching meals for letter {letter}: {e}")
+            return []
+
+    with create_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        http = HttpCache(session=session)
+        letter_results = list(executor.map(fetch, string.ascii_lowercase))
 
-    # Combine all collected DataFrames into one DataFrame
-    combined_df = pd.concat(all_meals, ignore_index=True)
+    # Merge in a-z order, a meal is only kept once
+    meals = {}
+    for results in letter_results:
+        for meal in results:
+            meals.setdefault(meal["idMeal"], meal)
+    return rename_meal_columns(pd.DataFrame(list(meals.values())))
+
+
+def get_meal_ingredients(meals_df):
+    """
+    Flattens the Ingredient1..20 / Measure1..20 columns of a renamed meal DataFrame
+    into a long table with one row per meal and ingredient.
+    """
+    columns = [f"{stub}{i}" for i in range(1, MAX_INGREDIENTS + 1) for stub in ("Ingredient", "Measure")]
+    wide = meals_df.reindex(columns=["idMeal"] + columns)
+    long_df = pd.wide_to_long(wide, stubnames=["Ingredient", "Measure"], i="idMeal", j="position").reset_index()
 
-    # Remove duplicate rows and return the cleaned DataFrame
-    unique_meals_df = combined_df.drop_duplicates()
-    return unique_meals_df
+    # Empty slots come back as None or blank strings
+    long_df["Ingredient"] = long_df["Ingredient"].astype("string").str.strip()
+    long_df["Measure"] = long_df["Measure"].astype("string").str.strip()
+    long_df = long_df[long_df["Ingredient"].fillna("") != ""]
+    return long_df.sort_values(["idMeal", "position"]).reset_index(drop=True)
 
 
 if __name__ == '__main__':
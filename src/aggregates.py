@@ -0,0 +1,257 @@
+"""
+@file: aggregates.py
+@date: 18/10/2026
+
+Daily price aggregates per trading good, kept up to date incrementally.
+
+daily_good_prices holds one row per good and snapshot date with the USD price normalized to the
+good's base unit (per kg, or per litre for liquids), the price per 1000 kcal and per gram of protein
+(from the average nutrition of the products matched to the good), and 7- and 30-day rolling averages
+of all three. The windows are calendar days ending at the row's date, averaged over the snapshots
+within them.
+
+After writing a snapshot the loader calls refresh() with the (good, date) keys it wrote. Only those
+rows are recomputed, plus the rolling windows of the 29 days after them, which include the new day.
+rebuild() recomputes everything (or a date range) from commodity_prices_usd, e.g. after the
+migration created the tables, after new nutrition data was loaded, or to recover:
+    DB_HOST=... DB_USER=... DB_PASS=... python aggregates.py --rebuild [--start 2025-05-01]
+
+Dashboards read the aggregates instead of joining the raw rows, e.g.
+    SELECT timestamp, usd_per_1000_kcal, avg_30d_usd_per_1000_kcal FROM daily_good_prices
+    WHERE trading_goods_name = 'Wheat' ORDER BY timestamp;
+"""
+
+import argparse
+import re
+import time
+from datetime import date
+
+import connections
+
+# Days covered by the rolling windows, the longer one also bounds what a refresh recomputes
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 30
+
+KG_PER_LB = 0.45359237
+LITRES_PER_GALLON = 3.785411784
+
+# Mass and volume of one traded unit, lower case without spaces; numbers in front multiply, e.g. 100KG
+MASS_UNITS_KG = {
+    'kg': 1.0, 'kgs': 1.0, 'g': 0.001,
+    't': 1000.0, 'mt': 1000.0, 'tonne': 1000.0, 'tonnes': 1000.0, 'ton': 1000.0,
+    'lb': KG_PER_LB, 'lbs': KG_PER_LB,
+    'cwt': 100 * KG_PER_LB,
+}
+VOLUME_UNITS_L = {'l': 1.0, 'litre': 1.0, 'liter': 1.0, 'gal': LITRES_PER_GALLON, 'gallon': LITRES_PER_GALLON}
+
+# A bushel is a volume, its weight depends on the grain
+BUSHEL_KG = {
+    "Wheat": 27.2155, "Soybeans": 27.2155, "Corn": 25.4012, "Oat": 14.5150, "Barley": 21.7724,
+    "Rice": 20.4117, "Canola": 22.6796, "Rapeseed": 22.6796,
+}
+
+# Eggs trade by the piece or dozen, about 60 g each
+EGG_KG = 0.06
+PIECE_UNITS = {'piece': 1, 'pieces': 1, 'pcs': 1, 'dozen': 12, 'doz': 12}
+
+# Liquids get prices per litre, their density (kg per litre) converts between mass and volume
+LIQUID_DENSITY = {"Milk": 1.03, "Orange Juice": 1.05, "Palm Oil": 0.89, "Sunflower Oil": 0.92}
+
+UNIT_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)?\s*([a-z ]+)$')
+
+REFRESH_NUTRITION_STMT = """
+    INSERT INTO good_nutrition (trading_goods_name, products, kcal_per_100g, protein_per_100g)
+    SELECT trading_goods_name, COUNT(*), AVG(kcal), AVG(protein)
+    FROM nutrition_data
+    WHERE trading_goods_name IN (SELECT trading_goods_name FROM aggregate_keys)
+    GROUP BY trading_goods_name
+    ON DUPLICATE KEY UPDATE
+    products = VALUES(products), kcal_per_100g = VALUES(kcal_per_100g), protein_per_100g = VALUES(protein_per_100g)
+"""
+
+# Nutrition values are per 100 g: 1 kg holds 10x kcal_per_100g kcal and 10x protein_per_100g grams
+REFRESH_DAILY_STMT = """
+    INSERT INTO daily_good_prices
+    (trading_goods_name, timestamp, converted_usd_price, unit, base_unit, usd_per_base_unit, usd_per_1000_kcal,
+     usd_per_g_protein)
+    SELECT c.trading_goods_name, c.timestamp, c.converted_usd_price, c.unit, u.base_unit,
+           c.converted_usd_price / u.base_units_per_unit,
+           c.converted_usd_price / u.kg_per_unit * 100 / NULLIF(n.kcal_per_100g, 0),
+           c.converted_usd_price / u.kg_per_unit / NULLIF(n.protein_per_100g * 10, 0)
+    FROM aggregate_keys k
+    JOIN commodity_prices_usd c ON c.trading_goods_name = k.trading_goods_name AND c.timestamp = k.timestamp
+    LEFT JOIN unit_conversions u ON u.trading_goods_name = c.trading_goods_name AND u.unit = c.unit
+    LEFT JOIN good_nutrition n ON n.trading_goods_name = c.trading_goods_name
+    ON DUPLICATE KEY UPDATE
+    converted_usd_price = VALUES(converted_usd_price), unit = VALUES(unit), base_unit = VALUES(base_unit),
+    usd_per_base_unit = VALUES(usd_per_base_unit), usd_per_1000_kcal = VALUES(usd_per_1000_kcal),
+    usd_per_g_protein = VALUES(usd_per_g_protein)
+"""
+
+WINDOW_METRICS = ['usd_per_base_unit', 'usd_per_1000_kcal', 'usd_per_g_protein']
+WINDOW_COLUMNS = [f'avg_{days}d_{metric}' for metric in WINDOW_METRICS for days in (SHORT_WINDOW_DAYS, LONG_WINDOW_DAYS)]
+
+# Every row from the first affected date of a good up to LONG_WINDOW_DAYS - 1 days after its last one
+# gets its windows recomputed from the rows within LONG_WINDOW_DAYS before it
+REFRESH_WINDOWS_STMT = f"""
+    INSERT INTO daily_good_prices (trading_goods_name, timestamp, {', '.join(WINDOW_COLUMNS)})
+    SELECT a.trading_goods_name, a.timestamp,
+           {', '.join(
+               f"AVG(CASE WHEN b.timestamp > a.timestamp - INTERVAL {SHORT_WINDOW_DAYS} DAY THEN b.{metric} END), "
+               f"AVG(b.{metric})"
+               for metric in WINDOW_METRICS)}
+    FROM (SELECT trading_goods_name, MIN(timestamp) AS first_day, MAX(timestamp) AS last_day
+          FROM aggregate_keys GROUP BY trading_goods_name) k
+    JOIN daily_good_prices a ON a.trading_goods_name = k.trading_goods_name
+        AND a.timestamp BETWEEN k.first_day AND k.last_day + INTERVAL {LONG_WINDOW_DAYS - 1} DAY
+    JOIN daily_good_prices b ON b.trading_goods_name = a.trading_goods_name
+        AND b.timestamp BETWEEN a.timestamp - INTERVAL {LONG_WINDOW_DAYS - 1} DAY AND a.timestamp
+    GROUP BY a.trading_goods_name, a.timestamp
+    ON DUPLICATE KEY UPDATE
+    {', '.join(f'{column} = VALUES({column})' for column in WINDOW_COLUMNS)}
+"""
+
+
+def unit_conversion(good, unit):
+    """
+    Converts a traded unit of a good into its base unit.
+
+    :param good: Trading goods name, bushels, pieces and liquids depend on it.
+    :param unit: Unit as scraped, e.g. "Bu", "T", "100KG" or "Lbs".
+    :return: Tuple (base_unit, base units per traded unit, kg per traded unit), base_unit is 'kg'
+             or 'l'. None if the unit is unknown, e.g. board feet.
+    """
+    match = UNIT_PATTERN.match(str(unit).strip().lower())
+    if not match:
+        return None
+    quantity = float(match.group(1) or 1)
+    name = match.group(2).strip()
+    density = LIQUID_DENSITY.get(good)
+
+    if name in VOLUME_UNITS_L:
+        litres = quantity * VOLUME_UNITS_L[name]
+        return 'l', litres, litres * density if density else None
+    if name in MASS_UNITS_KG:
+        kg = quantity * MASS_UNITS_KG[name]
+    elif name in ('bu', 'bushel', 'bushels') and good in BUSHEL_KG:
+        kg = quantity * BUSHEL_KG[good]
+    elif name in PIECE_UNITS and good.startswith("Eggs"):
+        kg = quantity * PIECE_UNITS[name] * EGG_KG
+    else:
+        return None
+    if density:
+        return 'l', kg / density, kg
+    return 'kg', kg, kg
+
+
+def stage_keys(cursor, keys):
+    # The keys go into a temporary table of this connection, the refresh statements join it
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS aggregate_keys (
+            trading_goods_name VARCHAR(100),
+            timestamp DATE,
+            PRIMARY KEY (trading_goods_name, timestamp)
+        )
+    """)
+    cursor.execute("DELETE FROM aggregate_keys")
+    cursor.executemany("INSERT IGNORE INTO aggregate_keys (trading_goods_name, timestamp) VALUES (%s, %s)", keys)
+
+
+def refresh_unit_conversions(cursor):
+    # Only the units of the affected rows, conversions of units seen before are simply rewritten
+    cursor.execute("""
+        SELECT DISTINCT c.trading_goods_name, c.unit
+        FROM aggregate_keys k
+        JOIN commodity_prices_usd c ON c.trading_goods_name = k.trading_goods_name AND c.timestamp = k.timestamp
+        WHERE c.unit IS NOT NULL
+    """)
+    conversions, unknown = [], []
+    for good, unit in cursor.fetchall():
+        conversion = unit_conversion(good, unit)
+        if conversion is None:
+            unknown.append(f"{good} ({unit})")
+            continue
+        conversions.append((good, unit, *conversion))
+    if conversions:
+        cursor.executemany(
+            "INSERT INTO unit_conversions (trading_goods_name, unit, base_unit, base_units_per_unit, kg_per_unit) "
+            "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE base_unit = VALUES(base_unit), "
+            "base_units_per_unit = VALUES(base_units_per_unit), kg_per_unit = VALUES(kg_per_unit)",
+            conversions
+        )
+    return unknown
+
+
+def refresh(conn, keys):
+    """
+    Recomputes the aggregates of the given (good, date) keys and the rolling windows they are part of.
+
+    :param conn: Open pymysql connection.
+    :param keys: (trading_goods_name, date) pairs written to commodity_prices_usd, dates as DATE
+                 or 'YYYYMMDD' strings.
+    :return: Summary dict with the number of keys, the goods whose unit has no conversion and the duration.
+    """
+    started = time.perf_counter()
+    keys = [(good, timestamp) for good, timestamp in keys if good is not None and timestamp is not None]
+    if not keys:
+        return {'keys': 0, 'unknown_units': [], 'seconds': 0.0}
+    try:
+        with conn.cursor() as cursor:
+            stage_keys(cursor, keys)
+            unknown = refresh_unit_conversions(cursor)
+            cursor.execute(REFRESH_NUTRITION_STMT)
+            cursor.execute(REFRESH_DAILY_STMT)
+            cursor.execute(REFRESH_WINDOWS_STMT)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'keys': len(keys), 'unknown_units': unknown, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+def frame_keys(df):
+    # Distinct (good, date) keys of a frame prepared for commodity_prices_usd
+    return list(df[['trading_goods_name', 'timestamp']].dropna().drop_duplicates().itertuples(index=False, name=None))
+
+
+def rebuild(conn, start=None, end=None):
+    """
+    Recomputes the aggregates from commodity_prices_usd and nutrition_data.
+
+    :param conn: Open pymysql connection.
+    :param start: First date to rebuild, None rebuilds all dates and drops stale rows.
+    :param end: Last date to rebuild, None for no upper bound.
+    :return: The refresh summary.
+    """
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp <= %s")
+        params.append(end)
+    with conn.cursor() as cursor:
+        if not conditions:
+            # Goods or days that disappeared from the raw tables must not survive a full rebuild
+            cursor.execute("DELETE FROM daily_good_prices")
+            cursor.execute("DELETE FROM good_nutrition")
+        cursor.execute(
+            "SELECT DISTINCT trading_goods_name, timestamp FROM commodity_prices_usd"
+            + (f" WHERE {' AND '.join(conditions)}" if conditions else ""),
+            params
+        )
+        keys = cursor.fetchall()
+    return refresh(conn, keys)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the daily price aggregates.")
+    parser.add_argument('--rebuild', action='store_true', required=True, help="recompute the aggregates")
+    parser.add_argument('--start', type=date.fromisoformat, help="first date to rebuild, YYYY-MM-DD, default all")
+    parser.add_argument('--end', type=date.fromisoformat, help="last date to rebuild, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    summary = rebuild(connections.get_connection(connect_timeout=10), args.start, args.end)
+    print(f"Rebuilt {summary['keys']} good/date rows in {summary['seconds']} s")
+    for unit in summary['unknown_units']:
+        print(f"  no unit conversion: {unit}")
@@ -0,0 +1,248 @@
+"""
+@file: backfill.py
+@date: 18/10/2026
+
+Parallel historical backfill of commodity_prices_usd.
+
+Lists every commodity snapshot in the bucket within a date range and loads them all. Download,
+parsing and USD conversion run in a process pool, the converted frames go through a bounded queue
+to a single writer thread, so a slow database holds back the workers instead of filling memory.
+The writer gets the files in snapshot order whatever order the workers finish in, so the latest
+snapshot of a day is always the one stored. The daily aggregates of every file are refreshed right
+after it is written. Every file written completely is recorded in loaded_files; a rerun skips files
+whose ETag did not change since, unless an earlier snapshot of the same day is loaded again.
+Rows are always written with the upsert strategy: several snapshots of one day share the primary
+key (trading_goods_name, timestamp), plain inserts would fail on the second one.
+
+Runs from the command line, e.g. against a local stand-in:
+    S3_ENDPOINT_URL=http://localhost:5000 DB_HOST=127.0.0.1 DB_USER=... DB_PASS=... \\
+        python backfill.py --start 2025-05-01 --end 2025-05-31 --workers 4
+
+Lambda offers no /dev/shm for multiprocessing, so the backfill is not a Lambda handler.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+
+import aggregates
+import bulk_writer
+import connections
+import loadingScript_DWH
+import rate_store
+
+DEFAULT_QUEUE_SIZE = 4
+
+# The only strategy that can write a day twice, LOAD_STRATEGY is not used here
+STRATEGY = 'upsert'
+
+
+def get_workers():
+    return int(os.environ.get('BACKFILL_WORKERS', os.cpu_count() or 1))
+
+
+def list_snapshots(s3, bucket, start=None, end=None):
+    """
+    Lists the commodity snapshots of the bucket whose snapshot date lies within [start, end].
+
+    :return: (day, key, etag) tuples, oldest snapshot first.
+    """
+    snapshots = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].endswith(loadingScript_DWH.RAW_SUFFIXES):
+                continue
+            # By snapshot time, the order the snapshots of one day are written in
+            snapshot = rate_store.snapshot_time(obj['Key'], fallback=obj['LastModified'])
+            if (start is None or snapshot.date() >= start) and (end is None or snapshot.date() <= end):
+                snapshots.append((snapshot, obj['Key'], obj['ETag']))
+    snapshots.sort()
+    return [(snapshot.date(), key, etag) for snapshot, key, etag in snapshots]
+
+
+def loaded_files(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT file_key, etag FROM loaded_files")
+        return dict(cursor.fetchall())
+
+
+def mark_loaded(conn, key, etag, row_count):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO loaded_files (file_key, etag, row_count) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE etag = VALUES(etag), row_count = VALUES(row_count)",
+            (key, etag, row_count)
+        )
+    conn.commit()
+
+
+def files_to_load(snapshots, done):
+    """
+    Picks the snapshots to load: new and changed files, and the later snapshots of their day, the
+    reloaded file would replace the prices they stored otherwise.
+
+    :param snapshots: (day, key, etag) tuples, oldest snapshot first.
+    :param done: ETag per file key of the files already loaded.
+    :return: (key, etag) tuples, oldest snapshot first.
+    """
+    pending_files = []
+    reloaded_days = set()
+    for day, key, etag in snapshots:
+        if done.get(key) != etag or day in reloaded_days:
+            pending_files.append((key, etag))
+            reloaded_days.add(day)
+    return pending_files
+
+
+def init_worker(store_path):
+    # Each worker reads the rate store once, the parent has refreshed it before starting the pool
+    rate_store._store = rate_store.RateStore(store_path)
+
+
+def prepare_file(bucket, key):
+    # Runs in a worker process: download, parse and convert one snapshot
+    body = connections.get_s3_client().get_object(Bucket=bucket, Key=key)['Body'].read()
+    df = loadingScript_DWH.read_raw_file(key, body, loadingScript_DWH.COMMODITY_COLUMNS)
+    df, unconvertible, _ = loadingScript_DWH.prepare_commodities(df, key, rate_store.get_store())
+    return df, unconvertible
+
+
+def write_results(conn, results, strategy, totals):
+    # Single writer: takes (key, etag, frame) from the queue until it gets None
+    while True:
+        item = results.get()
+        if item is None:
+            return
+        key, etag, df = item
+        try:
+            summary = bulk_writer.write_rows(conn, df, strategy=strategy)
+            totals['rows'] += summary['written']
+            totals['failed_rows'] += summary['failed']
+            if summary['failed']:
+                totals['failed_files'].append(f"{key}: {summary['errors'][:1]}")
+                continue
+            # Before the checkpoint, so a failed refresh is repeated by the next run
+            aggregates.refresh(conn, aggregates.frame_keys(df))
+            mark_loaded(conn, key, etag, len(df))
+            totals['files'] += 1
+        except Exception as e:
+            # Keep draining the queue, the workers would block on a dead writer otherwise
+            totals['failed_files'].append(f"{key}: {e}")
+
+
+def convert_files(pool, pending_files, workers, results, totals):
+    """
+    Converts the files in the pool and hands them to the writer in the order of pending_files.
+
+    Several snapshots of one day share the primary key, the upsert of the later snapshot has to come
+    last. Files finishing early wait in a reorder buffer until all files before them are handed on.
+
+    :param pool: Executor running prepare_file.
+    :param pending_files: (key, etag) tuples, oldest snapshot first.
+    :param workers: Size of the pool, two files per worker are in flight.
+    :param results: Queue of the writer thread, gets (key, etag, frame) tuples.
+    :param totals: Summary dict, failed files and unconvertible rows are added.
+    """
+    in_flight = {}
+    # Submit index -> (key, etag, frame), frame None for a failed file
+    finished_files = {}
+    next_index = 0
+    files = enumerate(pending_files)
+    while True:
+        # Keep every worker busy with one file in reserve, the queue limits the rest. The reorder buffer
+        # counts too, a slow first file must not let the others pile up in memory
+        while len(in_flight) + len(finished_files) < 2 * workers:
+            index, (key, etag) = next(files, (None, (None, None)))
+            if key is None:
+                break
+            in_flight[pool.submit(prepare_file, loadingScript_DWH.COMMODITY_BUCKET, key)] = (index, key, etag)
+        if not in_flight:
+            break
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, key, etag = in_flight.pop(future)
+            try:
+                df, unconvertible = future.result()
+            except Exception as e:
+                totals['failed_files'].append(f"{key}: {e}")
+                df, unconvertible = None, 0
+            totals['unconvertible'] += unconvertible
+            finished_files[index] = (key, etag, df)
+        while next_index in finished_files:
+            key, etag, df = finished_files.pop(next_index)
+            next_index += 1
+            if df is not None:
+                results.put((key, etag, df))
+
+
+def backfill(start=None, end=None, workers=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Loads all commodity snapshots between start and end into commodity_prices_usd.
+
+    :param start: First snapshot date to load, None for no lower bound.
+    :param end: Last snapshot date to load, None for no upper bound.
+    :param workers: Size of the process pool, defaults to BACKFILL_WORKERS or the CPU count.
+    :param queue_size: Converted files that may wait for the writer before the workers pause.
+    :return: Summary dict with file and row counts, duration and rows per second.
+    """
+    workers = workers or get_workers()
+    started = time.perf_counter()
+    s3 = connections.get_s3_client()
+    conn = connections.get_connection(connect_timeout=10)
+
+    # Skip files already loaded with the same content
+    done = loaded_files(conn)
+    snapshots = list_snapshots(s3, loadingScript_DWH.COMMODITY_BUCKET, start, end)
+    pending_files = files_to_load(snapshots, done)
+
+    store = rate_store.get_store()
+    # A full listing, a rate file uploaded out of order would change historical conversions
+    store.refresh(s3, loadingScript_DWH.EXCHANGE_BUCKET, loadingScript_DWH.EXCHANGE_PREFIX,
+                  loadingScript_DWH.RAW_SUFFIXES, full=True)
+
+    totals = {'files': 0, 'skipped_files': len(snapshots) - len(pending_files), 'rows': 0, 'failed_rows': 0,
+              'unconvertible': 0, 'failed_files': []}
+    results = queue.Queue(maxsize=queue_size)
+    writer = threading.Thread(target=write_results, args=(conn, results, STRATEGY, totals))
+    writer.start()
+
+    # spawn: the writer thread is already running, forking next to it is not safe
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(store.path,)) as pool:
+            convert_files(pool, pending_files, workers, results, totals)
+    finally:
+        results.put(None)
+        writer.join()
+
+    totals['seconds'] = round(time.perf_counter() - started, 3)
+    totals['rows_per_second'] = round(totals['rows'] / totals['seconds'], 1) if totals['seconds'] else 0.0
+    return totals
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load all commodity snapshots of a date range.")
+    parser.add_argument('--start', type=parse_date, help="first snapshot date, YYYY-MM-DD")
+    parser.add_argument('--end', type=parse_date, default=date.today(), help="last snapshot date, YYYY-MM-DD")
+    parser.add_argument('--workers', type=int, help="worker processes, defaults to BACKFILL_WORKERS or the CPU count")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="converted files waiting for the writer before the workers pause")
+    args = parser.parse_args()
+
+    summary = backfill(args.start, args.end, args.workers, args.queue_size)
+    print(f"Loaded {summary['files']} files ({summary['skipped_files']} already loaded, "
+          f"{len(summary['failed_files'])} failed): {summary['rows']} rows in {summary['seconds']} s, "
+          f"{summary['rows_per_second']} rows/s, {summary['unconvertible']} without USD price")
+    for failure in summary['failed_files']:
+        print(f"  failed: {failure}")
@@ -0,0 +1,229 @@
+import csv
+import hashlib
+import io
+import numbers
+import os
+import tempfile
+
+# Columns written to commodity_prices_usd, in insert order
+INSERT_COLUMNS = ['category', 'trading_goods_name', 'price', 'currency', 'unit', 'converted_usd_price', 'timestamp',
+                  'row_hash']
+
+# Primary key of commodity_prices_usd and the columns whose change counts as an update
+KEY_COLUMNS = ['trading_goods_name', 'timestamp']
+HASH_COLUMNS = ['category', 'price', 'currency', 'unit', 'converted_usd_price']
+
+# Write strategies, selectable with the LOAD_STRATEGY environment variable
+STRATEGIES = ('row', 'executemany', 'load_data', 'upsert')
+DEFAULT_STRATEGY = 'executemany'
+DEFAULT_BATCH_SIZE = 500
+
+# DataFrames are turned into tuples this many rows at a time, per-batch conversion costs 4x more
+FRAME_BLOCK_ROWS = 50000
+
+INSERT_STMT = f"""
+    INSERT INTO commodity_prices_usd
+    ({', '.join(INSERT_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(INSERT_COLUMNS))})
+"""
+
+UPSERT_STMT = INSERT_STMT + f"""
+    ON DUPLICATE KEY UPDATE
+    {', '.join(f'{column} = VALUES({column})' for column in HASH_COLUMNS + ['row_hash'])}
+"""
+
+LOAD_DATA_STMT = f"""
+    LOAD DATA LOCAL INFILE %s
+    INTO TABLE commodity_prices_usd
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+    LINES TERMINATED BY '\\n'
+    ({', '.join(INSERT_COLUMNS)})
+"""
+
+
+def get_strategy():
+    strategy = os.environ.get('LOAD_STRATEGY', DEFAULT_STRATEGY)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown LOAD_STRATEGY '{strategy}', expected one of {STRATEGIES}")
+    return strategy
+
+
+def get_batch_size():
+    return int(os.environ.get('LOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+
+
+HASH_INDEXES = [INSERT_COLUMNS.index(column) for column in HASH_COLUMNS]
+
+
+def row_hash(row):
+    """
+    64 bit hash of the HASH_COLUMNS of a row, as 16 hex characters.
+
+    Numbers are hashed by value, so 10, 10.0 and a numpy float give the same hash, whether the row
+    comes from a DataFrame or from plain tuples.
+
+    :param row: Tuple in INSERT_COLUMNS order, the row_hash slot may be missing.
+    :return: The hash.
+    """
+    parts = []
+    for idx in HASH_INDEXES:
+        value = row[idx]
+        if value is None:
+            parts.append('\\N')
+        elif isinstance(value, numbers.Number):
+            parts.append(repr(float(value)))
+        else:
+            parts.append(str(value))
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=8).hexdigest()
+
+
+def frame_to_rows(df):
+    # Plain tuples in insert order, NaN becomes None so it is written as NULL
+    values = df[INSERT_COLUMNS[:-1]].astype(object)
+    rows = values.where(values.notna(), None).itertuples(index=False, name=None)
+    return [row + (row_hash(row),) for row in rows]
+
+
+def iter_batches(rows, batch_size):
+    # Tuples are sliced directly, a DataFrame is converted block by block and then sliced
+    if isinstance(rows, (list, tuple)):
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+        return
+    block_size = max(batch_size, FRAME_BLOCK_ROWS)
+    for block_start in range(0, len(rows), block_size):
+        block = frame_to_rows(rows.iloc[block_start:block_start + block_size])
+        for start in range(0, len(block), batch_size):
+            yield block[start:start + batch_size]
+
+
+def write_batch_row(cursor, batch):
+    # One round trip per row, kept as reference for the bulk strategies
+    for row in batch:
+        cursor.execute(INSERT_STMT, row)
+    return {'written': len(batch)}
+
+
+def write_batch_executemany(cursor, batch):
+    # pymysql rewrites an INSERT ... VALUES executemany into multi-row INSERTs
+    cursor.executemany(INSERT_STMT, batch)
+    return {'written': len(batch)}
+
+
+def write_batch_load_data(cursor, batch):
+    # Build the batch as CSV in memory, NULL is written as \N
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in batch:
+        writer.writerow(['\\N' if value is None else value for value in row])
+
+    # pymysql only sends LOCAL INFILE data from a file, so spool the buffer to /tmp
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as tmp:
+        tmp.write(buffer.getvalue())
+        tmp.flush()
+        cursor.execute(LOAD_DATA_STMT, (tmp.name,))
+
+    # LOCAL loads skip duplicate keys with a warning instead of failing, so count what the server took
+    return {'written': cursor.rowcount}
+
+
+def existing_hashes(cursor, batch):
+    # Stored hashes of all rows sharing a snapshot date with the batch, keyed by primary key
+    timestamp_idx = INSERT_COLUMNS.index('timestamp')
+    timestamps = sorted({row[timestamp_idx] for row in batch})
+    cursor.execute(
+        f"SELECT trading_goods_name, timestamp, row_hash FROM commodity_prices_usd "
+        f"WHERE timestamp IN ({', '.join(['%s'] * len(timestamps))})",
+        timestamps
+    )
+    return {(name, snapshot_key(timestamp)): row_hash for name, timestamp, row_hash in cursor.fetchall()}
+
+
+def snapshot_key(timestamp):
+    # The column is a DATE, rows carry 'YYYYMMDD' strings
+    return timestamp.strftime('%Y%m%d') if hasattr(timestamp, 'strftime') else str(timestamp)
+
+
+def write_batch_upsert(cursor, batch):
+    # Compare row hashes first, only new and changed rows are sent to the database
+    name_idx, timestamp_idx = (INSERT_COLUMNS.index(column) for column in KEY_COLUMNS)
+    hash_idx = INSERT_COLUMNS.index('row_hash')
+    stored = existing_hashes(cursor, batch)
+
+    counts = {'written': 0, 'inserted': 0, 'updated': 0, 'skipped': 0}
+    changed = []
+    for row in batch:
+        stored_hash = stored.get((row[name_idx], snapshot_key(row[timestamp_idx])), False)
+        if stored_hash is False:
+            counts['inserted'] += 1
+        elif stored_hash != row[hash_idx]:
+            counts['updated'] += 1
+        else:
+            counts['skipped'] += 1
+            continue
+        changed.append(row)
+
+    if changed:
+        cursor.executemany(UPSERT_STMT, changed)
+    counts['written'] = len(changed)
+    return counts
+
+
+BATCH_WRITERS = {
+    'row': write_batch_row,
+    'executemany': write_batch_executemany,
+    'load_data': write_batch_load_data,
+    'upsert': write_batch_upsert,
+}
+
+
+def write_rows(conn, rows, strategy=None, batch_size=None):
+    """
+    Writes rows to commodity_prices_usd in batches and commits after every batch.
+
+    A failing batch is rolled back and counted as failed, the remaining batches are still written.
+    The load_data strategy needs a connection opened with local_infile=True. The upsert strategy
+    can be rerun safely: unchanged rows are skipped, changed ones updated in place.
+
+    :param conn: Open pymysql connection.
+    :param rows: DataFrame with the INSERT_COLUMNS except row_hash, or a list of tuples in INSERT_COLUMNS order.
+                 A DataFrame is converted in blocks of FRAME_BLOCK_ROWS, so its rows are never all held as tuples.
+    :param strategy: One of STRATEGIES, defaults to the LOAD_STRATEGY environment variable.
+    :param batch_size: Rows per batch, defaults to the LOAD_BATCH_SIZE environment variable.
+    :return: Summary dict with the strategy, batch count and number of rows written and failed,
+             plus inserted, updated and skipped rows for the upsert strategy.
+    """
+    import pymysql
+    strategy = strategy or get_strategy()
+    batch_size = batch_size or get_batch_size()
+    write_batch = BATCH_WRITERS[strategy]
+
+    summary = {'strategy': strategy, 'batches': 0, 'written': 0, 'failed': 0, 'errors': []}
+    if strategy == 'upsert':
+        summary.update(inserted=0, updated=0, skipped=0)
+    for batch in iter_batches(rows, batch_size):
+        summary['batches'] += 1
+        try:
+            with conn.cursor() as cursor:
+                counts = write_batch(cursor, batch)
+            conn.commit()
+            for name, count in counts.items():
+                summary[name] += count
+            summary['failed'] += len(batch) - counts['written'] - counts.get('skipped', 0)
+        except pymysql.MySQLError as e:
+            conn.rollback()
+            summary['failed'] += len(batch)
+            summary['errors'].append(str(e))
+    return summary
+
+
+def add_summary(total, summary):
+    # Adds the counts of one write_rows call to a running total, e.g. one call per chunk of a file
+    for name, value in summary.items():
+        if name == 'strategy':
+            total[name] = value
+        elif name == 'errors':
+            total.setdefault(name, []).extend(value)
+        else:
+            total[name] = total.get(name, 0) + value
+    return total
@@ -0,0 +1,83 @@
+import os
+
+# boto3 and pymysql are imported on first use: a handler that never touches the database does not load pymysql
+
+DB_NAME = 'lakecrusher'
+
+# Module-level state survives between warm invocations of the same Lambda container
+_connection = None
+_connection_options = None
+_s3_client = None
+
+STATS = {'db_connects': 0, 'db_reuses': 0, 's3_creates': 0, 's3_reuses': 0}
+
+
+def get_connection(**options):
+    """
+    Returns the database connection of this container, opening a new one only when needed.
+
+    A cached connection is pinged before reuse and its session is reset, so a transaction left
+    open by a failed invocation does not leak into the next one. Asking for different connect
+    options (e.g. local_infile) replaces the cached connection.
+
+    :param options: Extra keyword arguments for pymysql.connect, e.g. connect_timeout.
+    :return: An open pymysql connection.
+    """
+    global _connection, _connection_options
+    import pymysql
+
+    if _connection is not None and _connection.open and options == _connection_options:
+        try:
+            _connection.ping(reconnect=False)
+            reset_session(_connection)
+            STATS['db_reuses'] += 1
+            return _connection
+        except pymysql.MySQLError:
+            close_connection()
+
+    close_connection()
+    _connection = pymysql.connect(
+        host=os.environ['DB_HOST'],
+        user=os.environ['DB_USER'],
+        password=os.environ['DB_PASS'],
+        database=DB_NAME,
+        port=int(os.environ.get('DB_PORT', 3306)),
+        **options
+    )
+    _connection_options = options
+    STATS['db_connects'] += 1
+    return _connection
+
+
+def reset_session(connection):
+    # Drop any unfinished transaction and restore the default autocommit mode
+    connection.rollback()
+    connection.autocommit(False)
+
+
+def close_connection():
+    global _connection, _connection_options
+    if _connection is not None and _connection.open:
+        import pymysql
+        try:
+            _connection.close()
+        except pymysql.MySQLError:
+            pass
+    _connection = None
+    _connection_options = None
+
+
+def get_s3_client():
+    """
+    Returns the S3 client of this container, creating it on first use.
+
+    S3_ENDPOINT_URL points the client at an S3-compatible stand-in, e.g. for local runs.
+    """
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+        STATS['s3_creates'] += 1
+    else:
+        STATS['s3_reuses'] += 1
+    return _s3_client
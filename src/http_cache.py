@@ -0,0 +1,244 @@
+"""
+@file: http_cache.py
+@date: 18/10/2026
+
+Shared HTTP fetch layer with an on-disk cache for the scrapers.
+
+Response bodies are stored content-addressed (file name = sha256 of the body), a small index entry per
+URL keeps ETag/Last-Modified for conditional GETs. Settings come from the environment so every scraper
+shares the same cache:
+
+    HTTP_CACHE_DIR        cache directory (default /tmp/http_cache, the only writable path on Lambda)
+    HTTP_CACHE_OFFLINE    1 = serve only from the cache and never touch the network, requests to
+                          sources that are never cached (UNCACHED_SOURCES) fail with CacheMiss
+    HTTP_CACHE_MAX_BYTES  size limit of the stored bodies, least recently used ones are evicted first
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+import requests
+
+import metrics
+
+DEFAULT_CACHE_DIR = '/tmp/http_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Seconds a cached response is served without asking the server, 0 = always revalidate
+DEFAULT_TTLS = {
+    'nutritiontable': 7 * 24 * 3600,
+    'tradingeconomics': 0,
+    'themealdb': 24 * 3600,
+}
+
+# Sources whose responses are never stored: every call of a non-idempotent endpoint like random.php
+# returns something else, a stored copy is never useful again
+UNCACHED_SOURCES = {'themealdb-random'}
+
+
+class CacheMiss(requests.RequestException):
+    """Raised in offline mode when a URL is not in the cache."""
+
+
+class CachedResponse:
+    def __init__(self, url: str, status_code: int, content: bytes, headers: dict, from_cache: bool):
+        """
+        The parts of a requests.Response the scrapers use, for network and cache hits alike.
+
+        :param url: The requested URL.
+        :param status_code: HTTP status code.
+        :param content: The response body.
+        :param headers: Response headers.
+        :param from_cache: Whether the body was served from the cache.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class HttpCache:
+    def __init__(self, session: Optional[requests.Session] = None, ttls: Optional[dict] = None,
+                 cache_dir: Optional[str] = None, offline: Optional[bool] = None, max_bytes: Optional[int] = None,
+                 before_request: Optional[Callable[[str], None]] = None):
+        """
+        Initializes the fetch layer.
+
+        :param session: Session used for network requests, a new one is created if None.
+        :param ttls: Per-source TTLs in seconds, merged over DEFAULT_TTLS.
+        :param cache_dir: Cache directory, defaults to HTTP_CACHE_DIR.
+        :param offline: Serve only from the cache, defaults to HTTP_CACHE_OFFLINE.
+        :param max_bytes: Size limit of the stored bodies, defaults to HTTP_CACHE_MAX_BYTES.
+        :param before_request: Called with the URL before every network request, e.g. a rate limiter.
+        """
+        self.session = session or requests.Session()
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.cache_dir = cache_dir or os.environ.get('HTTP_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.offline = offline if offline is not None else os.environ.get('HTTP_CACHE_OFFLINE') == '1'
+        self.max_bytes = max_bytes or int(os.environ.get('HTTP_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.before_request = before_request
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(self.cache_dir, 'index'), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, 'blobs'), exist_ok=True)
+
+    def get(self, url: str, source: str = 'default', params: Optional[dict] = None,
+            headers: Optional[dict] = None, timeout: float = 30, ttl: Optional[float] = None,
+            store: Optional[bool] = None) -> CachedResponse:
+        """
+        Fetches a URL through the cache.
+
+        A fresh entry (younger than the TTL of its source) is served directly. An older one is
+        revalidated with If-None-Match / If-Modified-Since, so an unchanged page costs a 304 only.
+        Uncached requests always go to the network and raise CacheMiss in offline mode.
+
+        :param url: The URL to fetch.
+        :param source: Name of the source, selects the TTL.
+        :param params: Query parameters.
+        :param headers: Extra request headers.
+        :param timeout: Request timeout in seconds.
+        :param ttl: Overrides the TTL of the source, 0 always revalidates.
+        :param store: Whether the response goes through the cache, defaults to False for UNCACHED_SOURCES.
+        :return: The response, from the network or the cache.
+        """
+        full_url = url + ('?' + urlencode(sorted(params.items())) if params else '')
+        store = source not in UNCACHED_SOURCES if store is None else store
+        entry = self.read_entry(full_url) if store else None
+        content = self.read_blob(entry['blob']) if entry else None
+        if content is None:
+            entry = None
+
+        if self.offline:
+            if entry is None:
+                reason = "is not cached" if store else "is never cached"
+                raise CacheMiss(f"{full_url} {reason} and offline mode is on")
+            return self.cache_hit(full_url, entry, content)
+
+        ttl = self.ttls.get(source, 0) if ttl is None else ttl
+        if entry is not None and time.time() - entry['fetched_at'] < ttl:
+            return self.cache_hit(full_url, entry, content)
+
+        # Conditional GET for stale entries
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        if self.before_request:
+            self.before_request(full_url)
+        with metrics.span('http_fetch'):
+            response = self.session.get(url, params=params, headers=request_headers, timeout=timeout)
+        metrics.count('http_requests')
+        metrics.count('http_bytes', len(response.content), unit='Bytes')
+
+        if response.status_code == 304 and entry is not None:
+            entry['fetched_at'] = time.time()
+            self.write_entry(full_url, entry)
+            self.stats['revalidated'] += 1
+            return CachedResponse(full_url, 200, content, entry['headers'], from_cache=True)
+
+        self.stats['misses'] += 1
+        result = CachedResponse(full_url, response.status_code, response.content, dict(response.headers),
+                                from_cache=False)
+        if response.status_code == 200 and store:
+            self.store(full_url, result)
+        return result
+
+    def cache_hit(self, full_url: str, entry: dict, content: bytes) -> CachedResponse:
+        self.stats['hits'] += 1
+        metrics.count('http_cache_hits')
+        return CachedResponse(full_url, 200, content, entry['headers'], from_cache=True)
+
+    def store(self, full_url: str, response: CachedResponse) -> None:
+        blob = hashlib.sha256(response.content).hexdigest()
+        blob_path = self.blob_path(blob)
+        if not os.path.exists(blob_path):
+            self.write_atomic(blob_path, response.content)
+        self.write_entry(full_url, {
+            'url': full_url,
+            'blob': blob,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': {'Content-Type': response.headers.get('Content-Type', '')},
+            'fetched_at': time.time(),
+        })
+        self.evict()
+
+    def index_path(self, full_url: str) -> str:
+        return os.path.join(self.cache_dir, 'index', hashlib.sha256(full_url.encode()).hexdigest() + '.json')
+
+    def blob_path(self, blob: str) -> str:
+        return os.path.join(self.cache_dir, 'blobs', blob)
+
+    def read_entry(self, full_url: str) -> Optional[dict]:
+        try:
+            with open(self.index_path(full_url), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_entry(self, full_url: str, entry: dict) -> None:
+        self.write_atomic(self.index_path(full_url), json.dumps(entry).encode())
+
+    def read_blob(self, blob: str) -> Optional[bytes]:
+        path = self.blob_path(blob)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path)  # Mark as recently used for the eviction
+            return content
+        except OSError:
+            return None
+
+    @staticmethod
+    def write_atomic(path: str, data: bytes) -> None:
+        # Write to a unique temporary file first, so parallel workers never see half-written files
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used bodies until the cache fits into max_bytes.
+        Index entries pointing to a removed body are treated as misses on the next request.
+        """
+        with self.lock:
+            blob_dir = os.path.join(self.cache_dir, 'blobs')
+            blobs = []
+            for name in os.listdir(blob_dir):
+                try:
+                    stat = os.stat(os.path.join(blob_dir, name))
+                    blobs.append((stat.st_mtime, stat.st_size, name))
+                except OSError:
+                    continue
+            total = sum(size for _, size, _ in blobs)
+            for _, size, name in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(blob_dir, name))
+                    total -= size
+                    self.stats['evictions'] += 1
+                except OSError:
+                    continue
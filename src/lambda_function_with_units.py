@@ -1,81 +1,178 @@
+import csv
+import io
 import json
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import boto3
+import os
 from datetime import datetime
+from typing import Optional, TypedDict
 
-s3 = boto3.client('s3')  # connect to S3
+import connections
+import latest_index
+import metrics
+from http_cache import HttpCache
 
-def scrape_commodity_table(category_keyword):
-    url = "https://tradingeconomics.com/commodities"
+COMMODITY_BUCKET = "seraina-commodity-prod"
+COMMODITIES_URL = "https://tradingeconomics.com/commodities"
+
+# Format of the raw snapshots, "parquet" (typed) or "csv"
+RAW_FORMAT = os.environ.get("RAW_FORMAT", "parquet")
+
+# parser backend, lxml is considerably faster than the built-in html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Categories stored per run, more tables (e.g. Energy, Metals) only need to be added here
+DEFAULT_CATEGORIES = ("Agricultural", "Livestock")
+
+
+class CommodityRecord(TypedDict):
+    category: str
+    name: Optional[str]
+    price: Optional[float]
+    currency: Optional[str]
+    unit: Optional[str]
+
+
+def fetch_commodities_page():
     headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.content, "html.parser")
-    result = []
+    response = HttpCache().get(COMMODITIES_URL, source="tradingeconomics", headers=headers)
+    response.raise_for_status()
+    return response.content
+
+
+def parse_price(text):
+    # Prices are shown like "1,234.56", anything else counts as missing
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_commodity_row(row, category):
+    name_tag = row.find("b")
+    price_tag = row.find("td", {"id": "p"})
+    record = CommodityRecord(
+        category=category,
+        name=name_tag.get_text(strip=True) if name_tag else None,
+        price=parse_price(price_tag.get_text(strip=True)) if price_tag else None,
+        currency=None,
+        unit=None
+    )
+
+    # Get currency and unit, e.g. "USD/Bu"
+    first_cell = row.find("td", class_="datatable-item-first")
+    unit_div = first_cell.find("div") if first_cell else None
+    if unit_div:
+        unit_text = unit_div.get_text(strip=True)
+        if "/" in unit_text:
+            currency, unit = unit_text.split("/", 1)
+            record["currency"] = currency.strip()
+            record["unit"] = unit.strip()
+    return record
+
+
+def parse_commodity_tables(content, categories=DEFAULT_CATEGORIES):
+    """
+    Extracts the tables of several categories from the commodities page in one pass over its tables.
+    Like before, the first table whose header mentions a category is used for it.
 
-    tables = soup.find_all("table", class_="table-hover")
-    for table in tables:
+    :return: dict category -> list of CommodityRecord, empty lists for categories not found.
+    """
+    # Only tables are built into the tree, the rest of the page is skipped while parsing
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(content, HTML_PARSER, parse_only=SoupStrainer("table"))
+    result = {category: [] for category in categories}
+    remaining = list(categories)
+
+    for table in soup.find_all("table", class_="table-hover"):
         header = table.find("thead")
-        if header and category_keyword in header.get_text():
-            rows = table.find("tbody").find_all("tr", {"data-symbol": True})
-            for row in rows:
-                name = "Unknown"
-                price = "N/A"
-                currency = "N/A"
-                unit = "N/A"
-
-                # Get name
-                name_tag = row.find("b")
-                if name_tag:
-                    name = name_tag.get_text(strip=True)
-
-                # Get price
-                price_tag = row.find("td", {"id": "p"})
-                if price_tag:
-                    price = price_tag.get_text(strip=True)
-
-                # Get currency and unit
-                unit_div = row.find("td", class_="datatable-item-first").find("div")
-                if unit_div:
-                    unit_text = unit_div.get_text(strip=True)
-                    if "/" in unit_text:
-                        currency, unit = unit_text.split("/", 1)
-                        currency = currency.strip()
-                        unit = unit.strip()
-
-                result.append({
-                    "category": category_keyword,
-                    "name": name,
-                    "price": price,
-                    "currency": currency,
-                    "unit": unit
-                })
+        body = table.find("tbody")
+        if not header or not body:
+            continue
+        header_text = header.get_text()
+        matched = [category for category in remaining if category in header_text]
+        if not matched:
+            continue
+
+        rows = body.find_all("tr", {"data-symbol": True})
+        for category in matched:
+            result[category] = [parse_commodity_row(row, category) for row in rows]
+            remaining.remove(category)
+        if not remaining:
             break
     return result
 
 
+def scrape_commodity_tables(categories=DEFAULT_CATEGORIES):
+    """
+    Downloads the commodities page once and returns the tables of all requested categories.
+    """
+    content = fetch_commodities_page()
+    with metrics.span("parse"):
+        return parse_commodity_tables(content, categories)
+
+
+def scrape_commodity_table(category_keyword):
+    return scrape_commodity_tables((category_keyword,))[category_keyword]
+
+
+def records_to_csv(records):
+    # Same layout as DataFrame.to_csv(index=False): header row, None as empty field
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(CommodityRecord.__annotations__), lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode("utf-8")
+
+
 def lambda_handler(event, context):
-    agriculture = scrape_commodity_table("Agricultural")
-    livestock = scrape_commodity_table("Livestock")
-    all_data = agriculture + livestock
-
-    # Create DataFrame and convert to CSV
-    df = pd.DataFrame(all_data)
-    csv_data = df.to_csv(index=False)
-
-    # Generate filename with timestamp
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"commodity_data_{timestamp}.csv"
-
-    # Upload to S3
-    s3.put_object(
-        Bucket="seraina-commodity-prod",
-        Key=filename,
-        Body=csv_data
-    )
+    metrics.start("lambda_function_with_units")
+    try:
+        # One download and one parse for all categories
+        tables = scrape_commodity_tables(DEFAULT_CATEGORIES)
+        all_data = [record for category in DEFAULT_CATEGORIES for record in tables[category]]
+
+        # Serialize the records, typed Parquet through pandas unless RAW_FORMAT=csv, which needs no pandas
+        with metrics.span("serialize"):
+            if RAW_FORMAT == "csv":
+                body = records_to_csv(all_data)
+            else:
+                import pandas as pd
+                import raw_schema
+                df = pd.DataFrame(all_data, columns=list(CommodityRecord.__annotations__))
+                body = raw_schema.to_parquet_bytes(df, raw_schema.COMMODITY_SCHEMA)
+        metrics.count("rows", len(all_data))
+
+        # Generate filename with timestamp, stored under its date partition
+        now = datetime.utcnow()
+        timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
+        filename = latest_index.partition_prefix(now) + f"commodity_data_{timestamp}.{RAW_FORMAT}"
+
+        # Upload to S3, the client is reused by warm invocations
+        with metrics.span("s3_upload"):
+            s3 = connections.get_s3_client()
+            s3.put_object(
+                Bucket=COMMODITY_BUCKET,
+                Key=filename,
+                Body=body
+            )
+
+            # Point latest.json at the new file so the loader does not have to list the bucket
+            latest_index.write_pointer(s3, COMMODITY_BUCKET, filename, body, len(all_data))
+        metrics.count("s3_bytes", len(body), unit="Bytes")
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps(f"File {filename} uploaded to S3!"),
+            **metrics.finish()
+        }
 
-    return {
-        "statusCode": 200,
-        "body": json.dumps(f"File {filename} uploaded to S3!")
-    }
\ No newline at end of file
+    except Exception as e:
+        metrics.count("errors")
+        return {
+            "statusCode": 500,
+            "body": json.dumps(f"Error: {e}"),
+            **metrics.finish()
+        }
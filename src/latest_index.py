@@ -0,0 +1,108 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from botocore.exceptions import ClientError
+
+# Pointer object written next to the data files, e.g. latest.json
+POINTER_NAME = 'latest.json'
+
+# Data files are stored under date partitions like 2025/05/23/
+PARTITION_FORMAT = '%Y/%m/%d/'
+
+# Number of recent daily partitions checked before falling back to a scan of the whole prefix
+FALLBACK_DAYS = 7
+
+
+def partition_prefix(day, prefix=''):
+    return prefix + day.strftime(PARTITION_FORMAT)
+
+
+def write_pointer(s3, bucket, key, body, row_count, prefix=''):
+    """
+    Writes the latest.json pointer for a freshly uploaded data file.
+
+    :param s3: boto3 S3 client.
+    :param bucket: Bucket of the data file.
+    :param key: Key of the data file.
+    :param body: The uploaded bytes, used for the checksum.
+    :param row_count: Number of data rows in the file.
+    :param prefix: Prefix the pointer belongs to.
+    :return: The pointer dict.
+    """
+    pointer = {
+        'key': key,
+        'row_count': row_count,
+        'sha256': hashlib.sha256(body).hexdigest(),
+        'updated_at': datetime.utcnow().isoformat(timespec='seconds')
+    }
+    s3.put_object(Bucket=bucket, Key=prefix + POINTER_NAME, Body=json.dumps(pointer),
+                  ContentType='application/json')
+    return pointer
+
+
+def read_pointer(s3, bucket, prefix=''):
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=prefix + POINTER_NAME)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(obj['Body'].read())
+
+
+def verify_pointer(pointer, body):
+    verify_digest(pointer, hashlib.sha256(body).hexdigest())
+
+
+def verify_digest(pointer, sha256):
+    # For bodies that were hashed while streaming
+    if sha256 != pointer['sha256']:
+        raise Exception(f"Checksum mismatch for {pointer['key']}, the file changed after latest.json was written")
+
+
+def newest_key(s3, bucket, prefix, suffixes):
+    # Paginated listing, keeps only the running maximum instead of sorting all keys.
+    # File names carry the timestamp, so compare by name first to mix flat and partitioned keys.
+    latest = None
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.endswith(suffixes) and (latest is None or sort_key(key) > sort_key(latest)):
+                latest = key
+    return latest
+
+
+def sort_key(key):
+    return key.rsplit('/', 1)[-1], key
+
+
+def find_latest_key(s3, bucket, prefix='', suffixes=('.csv',), today=None):
+    """
+    Finds the newest data file of a prefix.
+
+    Reads the latest.json pointer if there is one. Otherwise the most recent date partitions are
+    listed first, and only if they are empty the whole prefix is scanned with pagination.
+
+    :param s3: boto3 S3 client.
+    :param bucket: Bucket to search.
+    :param prefix: Prefix to search.
+    :param suffixes: Accepted file endings.
+    :param today: Date to start the partition scan from, defaults to today (UTC).
+    :return: The key of the newest file and the pointer dict, or None for the pointer if it was scanned.
+    """
+    pointer = read_pointer(s3, bucket, prefix)
+    if pointer is not None:
+        return pointer['key'], pointer
+
+    today = today or datetime.utcnow().date()
+    for offset in range(FALLBACK_DAYS):
+        key = newest_key(s3, bucket, partition_prefix(today - timedelta(days=offset), prefix), suffixes)
+        if key:
+            return key, None
+
+    key = newest_key(s3, bucket, prefix, suffixes)
+    if not key:
+        raise Exception(f"No {'/'.join(suffixes)} files found in {bucket}/{prefix}")
+    return key, None
@@ -1,114 +1,364 @@
-import boto3
-import pandas as pd
-import pymysql
+import csv
+import hashlib
+import io
 import os
-from io import StringIO
+import re
+import resource
+import tempfile
+from io import BytesIO
 from datetime import datetime
 
-# Environment variables
-DB_HOST = os.environ['DB_HOST']
-DB_USER = os.environ['DB_USER']
-DB_PASS = os.environ['DB_PASS']
-DB_NAME = 'lakecrusher'
-DB_PORT = int(os.environ.get('DB_PORT', 3306))
+import aggregates
+import bulk_writer
+import connections
+import latest_index
+import metrics
+import rate_store
 
 COMMODITY_BUCKET = 'seraina-commodity-prod'
 EXCHANGE_BUCKET = 'exchange-rate-bucket-lakecrusher'
 EXCHANGE_PREFIX = 'exchange_rates/'
 
-s3 = boto3.client('s3')
-
-def get_latest_csv(bucket, prefix=''):
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    csv_files = sorted(
-        [obj['Key'] for obj in response.get('Contents', []) if obj['Key'].endswith('.csv')],
-        reverse=True
-    )
-    if not csv_files:
-        raise Exception(f"No CSV files found in {bucket}/{prefix}")
-    latest_key = csv_files[0]
-    obj = s3.get_object(Bucket=bucket, Key=latest_key)
-    return pd.read_csv(obj['Body']), latest_key
-
-def clean_currency(value):
-    value = str(value).upper()
-    if 'USD' in value:
-        return 'USD'
-    return value.strip()
+# Raw files the loader accepts, and the commodity columns it reads from them
+RAW_SUFFIXES = ('.parquet', '.csv')
+COMMODITY_COLUMNS = ['category', 'name', 'price', 'currency', 'unit']
+
+# Rows per chunk for the streaming load, 0 reads the whole file into one frame
+DEFAULT_CHUNK_SIZE = 0
+
+# Snapshots with at most this many rows (row_count of latest.json) are loaded without pandas, 0 disables it
+DEFAULT_FAST_PATH_MAX_ROWS = 1000
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+# Quotes in a minor unit end in a lowercase letter, e.g. "USd" (US cents), "AUd", "GBp"
+MINOR_UNIT_PATTERN = r'[A-Z]{2}[a-z]'
+MINOR_UNIT_DIVISOR = 100.0
+
+def read_raw_file(key, body, columns=None):
+    # Parquet is read natively with column projection, CSV stays supported for older files
+    import pandas as pd
+    if key.endswith('.parquet'):
+        return pd.read_parquet(BytesIO(body), columns=columns)
+    return pd.read_csv(BytesIO(body), usecols=columns)
+
+def get_frame(bucket, key, columns=None, pointer=None):
+    s3 = connections.get_s3_client()
+    with metrics.span('s3_get'):
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    metrics.count('s3_bytes', len(body), unit='Bytes')
+    if pointer is not None:
+        latest_index.verify_pointer(pointer, body)
+    with metrics.span('parse'):
+        return read_raw_file(key, body, columns)
+
+def get_latest_csv(bucket, prefix='', columns=None):
+    s3 = connections.get_s3_client()
+    latest_key, pointer = latest_index.find_latest_key(s3, bucket, prefix, suffixes=RAW_SUFFIXES)
+    return get_frame(bucket, latest_key, columns, pointer), latest_key
+
+def get_chunk_size():
+    return int(os.environ.get('LOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+def spool_object(bucket, key, pointer=None):
+    """
+    Streams an S3 object to a temporary file in /tmp, hashing it on the way.
+
+    The pointer checksum is verified before any row is read, so a file that changed after
+    latest.json was written is never partly loaded.
+
+    :return: Path of the temporary file, the caller removes it.
+    """
+    s3 = connections.get_s3_client()
+    digest = hashlib.sha256()
+    with metrics.span('s3_get'), tempfile.NamedTemporaryFile(suffix=os.path.splitext(key)[1], delete=False) as tmp:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body']
+        for block in body.iter_chunks(SPOOL_BLOCK_SIZE):
+            digest.update(block)
+            tmp.write(block)
+    metrics.count('s3_bytes', os.path.getsize(tmp.name), unit='Bytes')
+    try:
+        if pointer is not None:
+            latest_index.verify_digest(pointer, digest.hexdigest())
+    except Exception:
+        os.remove(tmp.name)
+        raise
+    return tmp.name
+
+def iter_raw_chunks(path, columns, chunk_size):
+    # Parquet is read batch by batch with column projection, CSV with the chunked reader
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+        with pd.read_csv(path, usecols=columns, chunksize=chunk_size) as reader:
+            yield from reader
+
+def load_in_chunks(conn, strategy, commodities_key, pointer, store, chunk_size):
+    """
+    Loads a commodity file chunk by chunk: each chunk is converted and written before the next is read.
+
+    Peak memory depends on the chunk size, not on the size of the file.
+
+    :return: The write summary over all chunks, the number of rows without USD price, the exchange files used
+             and the (good, date) keys written.
+    """
+    path = spool_object(COMMODITY_BUCKET, commodities_key, pointer)
+    summary, unconvertible, exchange_keys, keys = {}, 0, set(), set()
+    try:
+        chunks = iter_raw_chunks(path, COMMODITY_COLUMNS, chunk_size)
+        while True:
+            with metrics.span('parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            with metrics.span('convert'):
+                chunk, chunk_unconvertible, chunk_exchange_keys = prepare_commodities(chunk, commodities_key, store)
+            with metrics.span('db_write'):
+                bulk_writer.add_summary(summary, bulk_writer.write_rows(conn, chunk, strategy=strategy))
+            metrics.count('chunks')
+            unconvertible += chunk_unconvertible
+            exchange_keys.update(chunk_exchange_keys)
+            keys.update(aggregates.frame_keys(chunk))
+    finally:
+        os.remove(path)
+    if not summary:
+        summary = bulk_writer.write_rows(conn, [], strategy=strategy)
+    return summary, unconvertible, sorted(exchange_keys), sorted(keys)
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets the peak RSS (VmHWM) of the process, so each invocation measures its own
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    # VmHWM in KiB, since the last reset_peak_rss; ru_maxrss (whole process life) where /proc is missing
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def clean_currency(currency):
+    """
+    Vectorized clean_currency_value: a snapshot holds a handful of distinct currencies, each is cleaned once.
+
+    :param currency: Series of raw currency names.
+    :return: The currency codes and the divisor turning a quoted price into the major unit.
+    """
+    cleaned = {value: clean_currency_value(value) for value in currency.dropna().unique()}
+    codes = currency.map({value: code for value, (code, _) in cleaned.items()})
+    divisor = currency.map({value: divisor for value, (_, divisor) in cleaned.items()}).fillna(1.0)
+    return codes, divisor
+
+def clean_currency_value(currency):
+    """
+    Cleans a currency name: minor units ("USd", "AUd" are cents) become their major code, anything
+    mentioning USD counts as USD, other codes are upper-cased and stripped. A missing currency stays missing.
+
+    :return: The currency code and the divisor turning a quoted price into the major unit.
+    """
+    if currency is None:
+        return None, 1.0
+    currency = str(currency).strip()
+    divisor = MINOR_UNIT_DIVISOR if re.fullmatch(MINOR_UNIT_PATTERN, currency) else 1.0
+    currency = currency.upper()
+    return 'USD' if 'USD' in currency else currency, divisor
+
+def convert_to_usd(commodities_df, rates):
+    # rates holds the as-of rate per row, USD needs none
+    rate = rates.mask(commodities_df['currency'] == 'USD', 1.0)
+
+    # Missing or zero rates and missing prices give NaN
+    converted_usd = commodities_df['price'] / rate.where(rate != 0)
+    return converted_usd, int(converted_usd.isna().sum())
+
+def prepare_commodities(commodities_df, commodities_key, store):
+    """
+    Turns a raw commodity frame into rows for commodity_prices_usd.
+
+    :param commodities_df: Frame with the COMMODITY_COLUMNS, modified in place.
+    :param commodities_key: S3 key of the file, its name gives the snapshot time.
+    :param store: RateStore holding the exchange rates.
+    :return: The frame, the number of rows without USD price and the exchange files used.
+    """
+    snapshot_time = rate_store.snapshot_time(commodities_key, fallback=datetime.utcnow())
+
+    # Rename column for schema compatibility
+    commodities_df.rename(columns={'name': 'trading_goods_name'}, inplace=True)
+
+    # Normalize currency names and quote minor units in the major one, non-numeric prices are missing
+    # like in prepare_records
+    commodities_df['currency'], divisor = clean_currency(commodities_df['currency'])
+    import pandas as pd
+    commodities_df['price'] = pd.to_numeric(commodities_df['price'], errors='coerce') / divisor
+
+    # Convert prices to USD with the rates valid at the snapshot time
+    rates = store.lookup(commodities_df['currency'], snapshot_time)
+    commodities_df['converted_usd_price'], unconvertible = convert_to_usd(commodities_df, rates['rate'])
+    exchange_keys = sorted(rates['source_key'].dropna().unique())
+
+    # Add YYYYMMDD timestamp column, the date of the snapshot rather than of the load
+    commodities_df['timestamp'] = snapshot_time.strftime('%Y%m%d')
+    return commodities_df, unconvertible, exchange_keys
+
+def get_fast_path_max_rows():
+    return int(os.environ.get('LOAD_FAST_PATH_MAX_ROWS', DEFAULT_FAST_PATH_MAX_ROWS))
+
+def use_fast_path(pointer, chunk_size):
+    # Needs the row count of the pointer
+    return pointer is not None and not chunk_size and pointer['row_count'] <= get_fast_path_max_rows()
+
+def read_raw_records(key, body, columns):
+    # Pandas-free reader for small files: one dict per row, empty CSV fields become None
+    if key.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(BytesIO(body)).read(columns=columns).to_pylist()
+    reader = csv.DictReader(io.StringIO(body.decode('utf-8')))
+    return [{column: row.get(column) or None for column in columns} for row in reader]
+
+def parse_price(value):
+    # Like pd.to_numeric(errors='coerce'), non-numeric prices are missing
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if price != price else price
+
+def prepare_records(records, commodities_key, store):
+    """
+    Pandas-free prepare_commodities for small snapshots, the same cleaning and as-of conversion row by row.
+
+    :param records: Dicts with the COMMODITY_COLUMNS.
+    :param commodities_key: S3 key of the file, its name gives the snapshot time.
+    :param store: RateStore holding the exchange rates.
+    :return: Tuples in bulk_writer.INSERT_COLUMNS order, the number of rows without USD price and the
+             exchange files used.
+    """
+    snapshot_time = rate_store.snapshot_time(commodities_key, fallback=datetime.utcnow())
+    timestamp = snapshot_time.strftime('%Y%m%d')
+
+    # Same rules as clean_currency
+    cleaned = [clean_currency_value(record['currency']) for record in records]
+    currencies = [currency for currency, _ in cleaned]
+
+    rows, unconvertible, exchange_keys = [], 0, set()
+    for record, (currency, divisor), (rate, source_key) in zip(records, cleaned,
+                                                               store.lookup_rows(currencies, snapshot_time)):
+        if source_key is not None:
+            exchange_keys.add(source_key)
+        rate = 1.0 if currency == 'USD' else rate
+        price = parse_price(record['price'])
+        price = price / divisor if price is not None else None
+        converted_usd = price / rate if price is not None and rate else None
+        unconvertible += converted_usd is None
+        row = (record['category'], record['name'], price, currency, record['unit'], converted_usd, timestamp)
+        rows.append(row + (bulk_writer.row_hash(row),))
+    return rows, unconvertible, sorted(exchange_keys)
+
+def load_small_file(conn, strategy, commodities_key, pointer, store):
+    """
+    Loads a small commodity file with plain lists: csv or pyarrow to read it, no pandas import.
+
+    :return: The write summary, the number of rows without USD price, the exchange files used and the
+             (good, date) keys written.
+    """
+    with metrics.span('s3_get'):
+        body = connections.get_s3_client().get_object(Bucket=COMMODITY_BUCKET, Key=commodities_key)['Body'].read()
+    metrics.count('s3_bytes', len(body), unit='Bytes')
+    latest_index.verify_pointer(pointer, body)
+    with metrics.span('parse'):
+        records = read_raw_records(commodities_key, body, COMMODITY_COLUMNS)
+    with metrics.span('convert'):
+        rows, unconvertible, exchange_keys = prepare_records(records, commodities_key, store)
+    with metrics.span('db_write'):
+        summary = bulk_writer.write_rows(conn, rows, strategy=strategy)
+    name_idx, timestamp_idx = (bulk_writer.INSERT_COLUMNS.index(column) for column in bulk_writer.KEY_COLUMNS)
+    keys = sorted({(row[name_idx], row[timestamp_idx]) for row in rows if row[name_idx] is not None})
+    return summary, unconvertible, exchange_keys, keys
 
 def lambda_handler(event, context):
+    metrics.start('loadingScript_DWH')
+    rss_scope = 'this run' if reset_peak_rss() else 'container lifetime'
     try:
-        # Load CSVs from S3
-        commodities_df, commodities_key = get_latest_csv(COMMODITY_BUCKET)
-        exchange_df, exchange_key = get_latest_csv(EXCHANGE_BUCKET, EXCHANGE_PREFIX)
-
-        # Rename column for schema compatibility
-        commodities_df.rename(columns={'name': 'trading_goods_name'}, inplace=True)
-
-        # Normalize currency names
-        commodities_df['currency'] = commodities_df['currency'].apply(clean_currency)
-        exchange_rates = dict(zip(exchange_df['Currency'], exchange_df['ExchangeRate']))
-
-        # Convert prices to USD
-        converted_usd = []
-        for _, row in commodities_df.iterrows():
-            currency = row['currency']
-            price = row['price']
-            try:
-                if currency == 'USD':
-                    usd_price = float(price)
-                elif currency in exchange_rates:
-                    rate = float(exchange_rates[currency])
-                    usd_price = float(price) / rate if rate != 0 else None
-                else:
-                    usd_price = None
-            except:
-                usd_price = None
-            converted_usd.append(usd_price)
-
-        commodities_df['converted_usd_price'] = converted_usd
-
-        # Add YYYYMMDD timestamp column
-        timestamp_str = datetime.utcnow().strftime('%Y%m%d')
-        commodities_df['timestamp'] = timestamp_str
-
-        # Insert into RDS
-        conn = pymysql.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME,
-            port=DB_PORT,
-            connect_timeout=10
-        )
-
-        with conn.cursor() as cursor:
-            insert_stmt = """
-                INSERT INTO commodity_prices_usd
-                (category, trading_goods_name, price, currency, unit, converted_usd_price, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            for _, row in commodities_df.iterrows():
-                cursor.execute(insert_stmt, (
-                    row['category'],
-                    row['trading_goods_name'],
-                    row['price'],
-                    row['currency'],
-                    row['unit'],
-                    row['converted_usd_price'],
-                    row['timestamp']
-                ))
-
-        conn.commit()
-        conn.close()
+        # Find the latest commodity file in S3, or take the one given in the event to replay an old snapshot
+        replay_key = (event or {}).get('commodity_key')
+        if replay_key:
+            commodities_key, pointer = replay_key, None
+        else:
+            with metrics.span('s3_list'):
+                commodities_key, pointer = latest_index.find_latest_key(connections.get_s3_client(), COMMODITY_BUCKET,
+                                                                         suffixes=RAW_SUFFIXES)
+
+        # Add new exchange files to the rate store, only files not seen before are downloaded
+        with metrics.span('rate_refresh'):
+            store = rate_store.get_store()
+            added_rate_files = store.refresh(connections.get_s3_client(), EXCHANGE_BUCKET, EXCHANGE_PREFIX,
+                                             RAW_SUFFIXES)
+
+        # Insert into RDS, the connection stays open for the next warm invocation
+        strategy = bulk_writer.get_strategy()
+        with metrics.span('db_connect'):
+            conn = connections.get_connection(connect_timeout=10, local_infile=strategy == 'load_data')
+
+        chunk_size = get_chunk_size()
+        fast_path = use_fast_path(pointer, chunk_size)
+        if fast_path:
+            # A few dozen rows: plain lists are faster than importing pandas on a cold start
+            summary, unconvertible, exchange_keys, keys = load_small_file(conn, strategy, commodities_key, pointer,
+                                                                          store)
+        elif chunk_size:
+            # Stream the file, each chunk is converted and written before the next one is read
+            summary, unconvertible, exchange_keys, keys = load_in_chunks(conn, strategy, commodities_key, pointer,
+                                                                         store, chunk_size)
+        else:
+            # Load the whole file, only the needed columns
+            commodities_df = get_frame(COMMODITY_BUCKET, commodities_key, COMMODITY_COLUMNS, pointer)
+            with metrics.span('convert'):
+                commodities_df, unconvertible, exchange_keys = prepare_commodities(commodities_df, commodities_key,
+                                                                                   store)
+            with metrics.span('db_write'):
+                summary = bulk_writer.write_rows(conn, commodities_df, strategy=strategy)
+            keys = aggregates.frame_keys(commodities_df)
+
+        # Recompute the daily aggregates of the goods and dates just written
+        with metrics.span('aggregates'):
+            aggregate_summary = aggregates.refresh(conn, keys)
+        if aggregate_summary['unknown_units']:
+            print(f"No unit conversion for {aggregate_summary['unknown_units']}")
+
+        metrics.count('rows', summary['written'])
+        metrics.count('failed_rows', summary['failed'])
+        metrics.count('unconvertible_rows', unconvertible)
+        metrics.count('aggregate_keys', aggregate_summary['keys'])
+        print(f"Connection stats: {connections.STATS}")
+        print(f"Rate store: {store.table.num_rows} rates from {len(store.loaded_keys)} files, {len(added_rate_files)} new")
+        peak_rss = peak_rss_mb()
+        mode = 'fast path' if fast_path else f"chunk size {chunk_size or 'whole file'}"
+        print(f"Peak RSS: {peak_rss} MB ({rss_scope}, {mode})")
+        upsert_counts = (f", {summary['inserted']} inserted, {summary['updated']} updated, {summary['skipped']} unchanged"
+                         if strategy == 'upsert' else "")
 
         return {
             'statusCode': 200,
-            'body': f"Inserted {len(commodities_df)} rows into updated table using exchange file '{exchange_key}' and data file '{commodities_key}'"
+            'body': f"Inserted {summary['written']} rows ({summary['failed']} failed, {unconvertible} without USD price{upsert_counts}) "
+                    f"with strategy '{strategy}' into updated table using exchange files {exchange_keys} and data file '{commodities_key}', "
+                    f"refreshed {aggregate_summary['keys']} aggregate rows, peak RSS {peak_rss} MB ({rss_scope})",
+            **metrics.finish()
         }
 
     except Exception as e:
+        metrics.count('errors')
         return {
             'statusCode': 500,
-            'body': f"Error: {str(e)}"
-        }
\ No newline at end of file
+            'body': f"Error: {str(e)}",
+            **metrics.finish()
+        }
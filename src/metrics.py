@@ -0,0 +1,197 @@
+"""
+@file: metrics.py
+@date: 18/10/2026
+
+Per-stage timings and counters for the Lambda handlers.
+
+A handler starts an invocation, wraps its stages in spans and adds counters; helpers deeper down use
+the same module functions and report into the running invocation. At the end one CloudWatch Embedded
+Metric Format line is printed (CloudWatch turns it into metrics without API calls) and the handler
+adds the same numbers as a timings section to its response.
+
+    METRICS_ENABLED     0 = no spans, counters or log line; the functions return at once
+    METRICS_NAMESPACE   CloudWatch namespace, default LakeCrusher
+    METRICS_PROFILE     1 = sample the call stack while spans run and print the hottest lines of the
+                        slowest stage
+    METRICS_PROFILE_INTERVAL  seconds between two samples, default 0.005
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'LakeCrusher')
+PROFILE = os.environ.get('METRICS_PROFILE') == '1'
+PROFILE_INTERVAL = float(os.environ.get('METRICS_PROFILE_INTERVAL', 0.005))
+PROFILE_TOP = 10
+
+# Shared no-op span, returned while metrics are disabled or no invocation is running
+_NO_SPAN = nullcontext()
+
+# The first invocation of a container is its cold start
+_invocation_count = 0
+_current = None
+
+
+class StackSampler:
+    """
+    Sampling profiler: a background thread records the innermost frames of the handler thread.
+
+    Every sample is filed under the span open at that moment, so the report can focus on the
+    slowest stage. Sampling costs a little time on the sampler thread only.
+    """
+
+    def __init__(self, invocation, interval):
+        self.invocation = invocation
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            stage = self.invocation.open_spans[-1] if self.invocation.open_spans else None
+            frame = sys._current_frames().get(self.thread_id)
+            if stage is None or frame is None:
+                continue
+            # Innermost frame outside this module, where the time is actually spent
+            while frame is not None and frame.f_code.co_filename == __file__:
+                frame = frame.f_back
+            if frame is not None:
+                location = f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+                self.samples.setdefault(stage, Counter())[location] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self, stage):
+        counts = self.samples.get(stage, Counter())
+        total = sum(counts.values())
+        return [{'location': location, 'share': round(count / total, 3)}
+                for location, count in counts.most_common(PROFILE_TOP)]
+
+
+class Invocation:
+    def __init__(self, function_name, cold_start, profile):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.counters = {}
+        self.units = {}
+        self.open_spans = []
+        self.sampler = StackSampler(self, PROFILE_INTERVAL) if profile else None
+
+    @contextmanager
+    def span(self, name):
+        self.open_spans.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Spans of the same name add up, e.g. one per chunk
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+            self.open_spans.pop()
+
+    def count(self, name, value, unit):
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.units[name] = unit
+
+    def summary(self):
+        summary = {
+            'cold_start': self.cold_start,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages_ms': {name: round(value, 2) for name, value in self.timings.items()},
+            'counters': dict(self.counters),
+        }
+        if self.sampler is not None and self.timings:
+            slowest = max(self.timings, key=self.timings.get)
+            summary['profile'] = {'stage': slowest, 'hot_spots': self.sampler.report(slowest)}
+        return summary
+
+    def emf_line(self, summary):
+        # CloudWatch Embedded Metric Format: the metric values are top-level keys of the log line
+        stages = {f"{name}_ms": value for name, value in summary['stages_ms'].items()}
+        values = {'ColdStart': int(self.cold_start), 'total_ms': summary['total_ms'], **stages, **summary['counters']}
+        metric_units = {'ColdStart': 'Count', 'total_ms': 'Milliseconds', **dict.fromkeys(stages, 'Milliseconds'),
+                        **self.units}
+        return json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, unit in metric_units.items()],
+                }],
+            },
+            'FunctionName': self.function_name,
+            **values,
+        })
+
+
+def start(function_name):
+    """
+    Starts the metrics of a handler invocation, spans and counters from anywhere report into it.
+
+    :param function_name: Name used as CloudWatch dimension.
+    """
+    global _current, _invocation_count
+    _invocation_count += 1
+    if ENABLED:
+        _current = Invocation(function_name, cold_start=_invocation_count == 1, profile=PROFILE)
+
+
+def span(name):
+    """
+    Context manager timing a stage of the running invocation.
+    """
+    if _current is None:
+        return _NO_SPAN
+    return _current.span(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a stage.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, unit='Count'):
+    """
+    Adds to a counter of the running invocation, e.g. rows, bytes (unit='Bytes') or requests.
+    """
+    if _current is not None:
+        _current.count(name, value, unit)
+
+
+def finish():
+    """
+    Ends the running invocation: prints the EMF log line and returns the timings section for the response.
+
+    :return: {'timings': summary} while metrics are enabled, {} otherwise.
+    """
+    global _current
+    invocation, _current = _current, None
+    if invocation is None:
+        return {}
+    if invocation.sampler is not None:
+        invocation.sampler.stop()
+    summary = invocation.summary()
+    print(invocation.emf_line(summary))
+    return {'timings': summary}
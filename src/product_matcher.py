@@ -0,0 +1,231 @@
+"""
+@file: product_matcher.py
+@date: 18/10/2026
+
+Links nutrition products to the trading goods of the warehouse.
+
+The goods vocabulary (VALID_GOODS plus synonyms) is compiled once into a character-trigram index:
+one 0/1 row per phrase over all trigrams that occur in any phrase. A block of product names becomes
+the same kind of matrix, and one matrix product gives the shared trigrams of every product with every
+phrase. The score of a phrase is mostly how much of it appears in the product name (containment),
+with a little Dice similarity so that longer, more specific phrases win ties.
+
+Results are cached on disk keyed by the normalized product name (PRODUCT_MATCH_CACHE, default
+/tmp/product_matches.json), so a refresh only matches products it has not seen. The cache is dropped
+when the vocabulary changes.
+
+Usage:
+    python product_matcher.py nutritionTable.csv     # writes nutritionTable_matched.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from CommodityTableCreator import VALID_GOODS
+
+DEFAULT_CACHE_PATH = '/tmp/product_matches.json'
+DEFAULT_MIN_CONFIDENCE = 0.75
+BLOCK_SIZE = 4096
+
+# Weights of containment and Dice similarity in the score
+CONTAINMENT_WEIGHT = 0.8
+DICE_WEIGHT = 0.2
+
+# Names used on nutrition labels for each good, the good's own name is always included
+SYNONYMS = {
+    "Soybeans": ["soybean", "soy", "soya", "soy bean", "tofu", "edamame", "soy milk", "soy sauce"],
+    "Wheat": ["wheat flour", "whole wheat", "bread", "pasta", "semolina", "bulgur", "couscous", "spelt"],
+    "Lumber": ["timber", "wood"],
+    "Palm Oil": ["palm kernel oil", "palm fat"],
+    "Cheese": ["cheddar", "gouda", "emmental", "mozzarella", "parmesan", "brie", "camembert", "feta",
+               "gruyere", "cottage cheese", "cream cheese", "quark"],
+    "Milk": ["whole milk", "skimmed milk", "buttermilk", "yogurt", "yoghurt", "kefir", "cream", "milk powder"],
+    "Orange Juice": ["orange", "orange juice"],
+    "Coffee": ["espresso", "cappuccino"],
+    "Cotton": ["cottonseed oil"],
+    "Rice": ["basmati", "risotto", "rice milk"],
+    "Canola": ["canola oil"],
+    "Oat": ["oats", "oatmeal", "oat flakes", "porridge", "oat milk"],
+    "Sugar": ["sucrose", "icing sugar", "brown sugar", "cane sugar"],
+    "Cocoa": ["chocolate", "cacao", "cocoa powder", "cocoa butter"],
+    "Tea": ["green tea", "black tea"],
+    "Sunflower Oil": ["sunflower seeds"],
+    "Rapeseed": ["rapeseed oil"],
+    "Barley": ["pearl barley", "malt"],
+    "Butter": ["ghee", "butterfat"],
+    "Potatoes": ["potato", "mashed potatoes", "potato crisps", "french fries"],
+    "Corn": ["maize", "sweet corn", "popcorn", "cornflakes", "polenta", "corn starch"],
+    "Beef": ["steak", "veal", "minced beef", "roast beef", "sirloin"],
+    "Lean Hogs": ["pork", "ham", "bacon", "pork chop", "salami"],
+    "Poultry": ["chicken", "turkey", "duck", "goose"],
+    # Both egg goods only differ by market, label names cannot tell them apart; the first one wins
+    "Eggs US": ["egg", "eggs", "egg yolk", "egg white"],
+    "Salmon": ["smoked salmon"],
+}
+
+# Names that contain a good's name but are something else, they match to no good
+EXCLUSIONS = ["peanut butter", "almond butter", "butternut squash", "sweet potato", "coconut milk",
+              "almond milk", "corn salad", "rice paper", "wood ear"]
+
+
+def normalize(name: str) -> str:
+    """
+    Lower case without accents and punctuation, words separated by single spaces.
+    """
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r'[^a-z0-9]+', ' ', text).strip()
+
+
+def trigrams(text: str) -> set:
+    # Every word is padded, so "oat" matches the start of "oats" but not the middle of "goat"
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[idx:idx + 3] for idx in range(len(padded) - 2))
+    return grams
+
+
+class ProductMatcher:
+    """
+    Matches product names to trading goods with a precompiled trigram index.
+    """
+
+    def __init__(self, goods: Iterable[str] = VALID_GOODS, synonyms: Optional[dict] = None,
+                 exclusions: Iterable[str] = EXCLUSIONS, min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                 cache_path: Optional[str] = None):
+        """
+        Compiles the vocabulary and loads the match cache.
+
+        :param goods: The trading goods names.
+        :param synonyms: dict good -> list of further names, defaults to SYNONYMS.
+        :param exclusions: Names that must not match any good.
+        :param min_confidence: Scores below this give no match.
+        :param cache_path: JSON cache file, defaults to PRODUCT_MATCH_CACHE.
+        """
+        synonyms = SYNONYMS if synonyms is None else synonyms
+        phrases = {}
+        for good in goods:
+            for name in [good] + synonyms.get(good, []):
+                phrases.setdefault(normalize(name), good)
+        for name in exclusions:
+            phrases[normalize(name)] = None
+
+        self.phrases = list(phrases)
+        self.phrase_goods = [phrases[phrase] for phrase in self.phrases]
+        self.min_confidence = min_confidence
+
+        # Trigram -> column, and the phrase x trigram incidence matrix
+        phrase_grams = [trigrams(phrase) for phrase in self.phrases]
+        self.gram_index = {gram: idx for idx, gram in enumerate(sorted(set().union(*phrase_grams)))}
+        self.phrase_matrix = np.zeros((len(self.phrases), len(self.gram_index)), dtype=np.float32)
+        for row, grams in enumerate(phrase_grams):
+            self.phrase_matrix[row, [self.gram_index[gram] for gram in grams]] = 1
+        self.phrase_sizes = self.phrase_matrix.sum(axis=1)
+
+        # The cache is only valid for the vocabulary it was built with
+        self.version = hashlib.sha256(json.dumps([self.phrases, self.phrase_goods, min_confidence])
+                                      .encode()).hexdigest()[:16]
+        self.cache_path = cache_path or os.environ.get('PRODUCT_MATCH_CACHE', DEFAULT_CACHE_PATH)
+        self.cache = self.load_cache()
+        self.stats = {'cached': 0, 'matched': 0}
+
+    def load_cache(self) -> dict:
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache['matches'] if cache.get('version') == self.version else {}
+
+    def save_cache(self) -> None:
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'matches': self.cache}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def score_block(self, names: list) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores a block of normalized names against all phrases at once.
+
+        :return: Index of the best phrase and its score for every name.
+        """
+        product_matrix = np.zeros((len(names), len(self.gram_index)), dtype=np.float32)
+        product_sizes = np.zeros(len(names), dtype=np.float32)
+        for row, name in enumerate(names):
+            grams = trigrams(name)
+            product_sizes[row] = len(grams)
+            product_matrix[row, [self.gram_index[gram] for gram in grams if gram in self.gram_index]] = 1
+
+        shared = product_matrix @ self.phrase_matrix.T
+        containment = shared / self.phrase_sizes
+        dice = 2 * shared / (product_sizes[:, None] + self.phrase_sizes)
+        scores = CONTAINMENT_WEIGHT * containment + DICE_WEIGHT * dice
+        best = scores.argmax(axis=1)
+        return best, scores[np.arange(len(names)), best]
+
+    def match_many(self, product_names: Iterable[str]) -> pd.DataFrame:
+        """
+        Finds the trading good of every product name, names seen before are served from the cache.
+
+        :param product_names: The product names, duplicates are matched once.
+        :return: DataFrame with product_name, trading_goods_name (None without match) and confidence,
+                 one row per input name in input order.
+        """
+        product_names = list(product_names)
+        normalized = [normalize(name) for name in product_names]
+        missing = sorted(set(normalized) - self.cache.keys())
+        self.stats['cached'] += len(set(normalized)) - len(missing)
+        self.stats['matched'] += len(missing)
+
+        for start in range(0, len(missing), BLOCK_SIZE):
+            block = missing[start:start + BLOCK_SIZE]
+            best, scores = self.score_block(block)
+            for name, phrase_idx, score in zip(block, best, scores):
+                good = self.phrase_goods[phrase_idx] if score >= self.min_confidence else None
+                self.cache[name] = [good, round(float(score), 3)]
+        if missing:
+            self.save_cache()
+
+        matches = [self.cache[name] for name in normalized]
+        return pd.DataFrame({
+            'product_name': product_names,
+            # object keeps None for products without match, a string column would turn it into NaN
+            'trading_goods_name': pd.Series([good for good, _ in matches], dtype=object),
+            'confidence': [confidence for _, confidence in matches],
+        })
+
+    def match(self, product_name: str) -> tuple[Optional[str], float]:
+        """
+        Finds the trading good of one product name.
+
+        :return: Tuple of (trading good or None, confidence).
+        """
+        row = self.match_many([product_name]).iloc[0]
+        return row['trading_goods_name'], float(row['confidence'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add the matching trading good to a nutrition table CSV.")
+    parser.add_argument('csv_path', help="nutrition table as written by Extract_NutritionTable.py")
+    parser.add_argument('--output', help="output CSV, defaults to <input>_matched.csv")
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    nutrition_df = pd.read_csv(args.csv_path, sep=';')
+    matcher = ProductMatcher(min_confidence=args.min_confidence)
+    matches = matcher.match_many(nutrition_df['Product Name'])
+    nutrition_df['trading_goods_name'] = matches['trading_goods_name'].to_numpy()
+    nutrition_df['match_confidence'] = matches['confidence'].to_numpy()
+
+    output = args.output or os.path.splitext(args.csv_path)[0] + '_matched.csv'
+    nutrition_df.to_csv(output, sep=';', encoding='utf-8', index=False)
+    print(f"{nutrition_df['trading_goods_name'].notna().sum()} of {len(nutrition_df)} products matched "
+          f"({matcher.stats['cached']} from cache), written to {output}")
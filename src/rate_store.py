@@ -0,0 +1,271 @@
+"""
+@file: rate_store.py
+@date: 18/10/2026
+
+Time-indexed store of all exchange-rate snapshots.
+
+Every snapshot file in the exchange bucket adds one rate per currency, valid from the snapshot time
+until the next snapshot. Commodity rows are matched to the rate valid at their own snapshot time with
+a vectorized as-of join, so replaying an old commodity file uses the rates of that day.
+
+The store is kept as one sorted Parquet file (RATE_STORE_PATH, default /tmp/rate_store.parquet) with a
+copy in the exchange bucket (RATE_STORE_S3_KEY, default rate_store/rate_store.parquet, empty disables
+it), so a cold Lambda with an empty /tmp downloads one file instead of every exchange file. Exchange
+files are named by date: a refresh only lists the keys after the newest one in the store and downloads
+those. Loading and refreshing only need pyarrow; pandas is imported by the vectorized lookup, small
+snapshots use lookup_rows instead.
+"""
+
+import bisect
+import csv
+import io
+import os
+import re
+from datetime import datetime, timezone
+
+DEFAULT_PATH = '/tmp/rate_store.parquet'
+DEFAULT_S3_KEY = 'rate_store/rate_store.parquet'
+
+# Snapshot times in file names, e.g. commodity_data_2025-05-23_06-00-00.csv or rates_20250523.csv
+SNAPSHOT_PATTERN = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})(?:[_T ]?(\d{2})[-:]?(\d{2})[-:]?(\d{2}))?')
+
+# Columns read from the exchange files, and the columns of the store
+EXCHANGE_COLUMNS = ['Currency', 'ExchangeRate']
+COLUMNS = ['currency', 'valid_from', 'rate', 'source_key']
+
+
+def store_schema():
+    import pyarrow as pa
+    return pa.schema([('currency', pa.string()), ('valid_from', pa.timestamp('us')), ('rate', pa.float64()),
+                      ('source_key', pa.string())])
+
+
+def snapshot_time(key, fallback=None):
+    """
+    Reads the snapshot time from a file name, the date alone means midnight.
+
+    :param key: S3 key of the file.
+    :param fallback: Returned if the name holds no date, e.g. the LastModified time of the object.
+    :return: The snapshot time as naive UTC datetime.
+    """
+    match = SNAPSHOT_PATTERN.search(key.rsplit('/', 1)[-1])
+    if match:
+        parts = [int(part) if part else 0 for part in match.groups()]
+        try:
+            return datetime(*parts)
+        except ValueError:
+            pass
+    if fallback is None:
+        raise ValueError(f"No snapshot time in {key}")
+    return fallback.astimezone(timezone.utc).replace(tzinfo=None) if fallback.tzinfo else fallback
+
+
+def parse_rate(value):
+    # Like pd.to_numeric(errors='coerce'): anything that is not a number is missing
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if rate != rate else rate
+
+
+def read_rates(key, body):
+    """
+    Reads an exchange file without pandas, the store is refreshed on every (cold) loader run.
+
+    :return: (currency, rate) tuples, currencies upper-cased and stripped, rate None if not a number.
+    """
+    if key.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        records = pq.ParquetFile(io.BytesIO(body)).read(columns=EXCHANGE_COLUMNS).to_pylist()
+    else:
+        records = csv.DictReader(io.StringIO(body.decode('utf-8')))
+    return [(str(record['Currency']).strip().upper(), parse_rate(record['ExchangeRate'])) for record in records]
+
+
+def rows_to_table(rows):
+    """
+    Builds an Arrow table with the store schema from (currency, valid_from, rate, source_key) tuples.
+
+    Arrow imports pandas to convert Python lists, its CSV reader builds the columns natively instead.
+    """
+    import pyarrow.csv as pv
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for currency, valid_from, rate, source_key in rows:
+        writer.writerow([currency, valid_from.isoformat(sep=' '), '' if rate is None else repr(rate), source_key])
+    return pv.read_csv(io.BytesIO(buffer.getvalue().encode('utf-8')),
+                       convert_options=pv.ConvertOptions(column_types=store_schema(), strings_can_be_null=False))
+
+
+class RateStore:
+    def __init__(self, path=None):
+        """
+        Loads the store file, or starts empty if there is none yet.
+
+        The store is held as Arrow table, pandas is only imported by the vectorized lookup.
+
+        :param path: Path of the Parquet store, defaults to RATE_STORE_PATH.
+        """
+        self.path = path or os.environ.get('RATE_STORE_PATH', DEFAULT_PATH)
+        self.load()
+
+    def load(self):
+        import pyarrow.parquet as pq
+        try:
+            # ParquetFile instead of read_table, which imports pandas
+            self.table = pq.ParquetFile(self.path).read(columns=COLUMNS).cast(store_schema())
+        except (OSError, ValueError):
+            self.table = rows_to_table([])
+        self.loaded_keys = set(self.table.column('source_key').to_pylist())
+        self._rates = None
+        self._index = None
+
+    @property
+    def rates(self):
+        # The store as DataFrame, built on first use
+        if self._rates is None:
+            self._rates = self.table.to_pandas().astype({'currency': object, 'source_key': object})
+        return self._rates
+
+    def seed(self, s3, bucket, store_key):
+        """
+        Replaces the local store with the copy in S3, e.g. on a cold start with an empty /tmp.
+
+        :return: Whether there was a copy.
+        """
+        from botocore.exceptions import ClientError
+        try:
+            body = s3.get_object(Bucket=bucket, Key=store_key)['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return False
+            raise
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, self.path)
+        self.load()
+        return True
+
+    def refresh(self, s3, bucket, prefix='', suffixes=('.csv', '.parquet'), store_key=None, full=False):
+        """
+        Adds the snapshot files of the bucket prefix that are not in the store yet.
+
+        An empty store is first seeded from its copy in S3, the copy is updated whenever files are added.
+        Only keys sorting after the newest key in the store are listed, full=True lists the whole prefix,
+        e.g. to pick up a file that was uploaded out of order.
+
+        :param store_key: Key of the store copy in the bucket, defaults to RATE_STORE_S3_KEY, '' for none.
+        :param full: Whether to list the whole prefix.
+        :return: The keys added.
+        """
+        store_key = os.environ.get('RATE_STORE_S3_KEY', DEFAULT_S3_KEY) if store_key is None else store_key
+        if store_key and not self.loaded_keys:
+            self.seed(s3, bucket, store_key)
+
+        list_args = {'Bucket': bucket, 'Prefix': prefix}
+        known_keys = [key for key in self.loaded_keys if key.startswith(prefix)]
+        if known_keys and not full:
+            list_args['StartAfter'] = max(known_keys)
+        new_objects = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**list_args):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(suffixes) and obj['Key'] not in self.loaded_keys and obj['Key'] != store_key:
+                    new_objects.append(obj)
+        if not new_objects:
+            return []
+
+        import pyarrow as pa
+        rows = []
+        for obj in new_objects:
+            body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+            valid_from = snapshot_time(obj['Key'], fallback=obj['LastModified'])
+            rows.extend((currency, valid_from, rate, obj['Key']) for currency, rate in read_rates(obj['Key'], body))
+        self.table = self.sort(pa.concat_tables([self.table, rows_to_table(rows)]))
+        self.loaded_keys.update(obj['Key'] for obj in new_objects)
+        self._rates = self._index = None
+        self.save()
+        if store_key:
+            with open(self.path, 'rb') as f:
+                s3.put_object(Bucket=bucket, Key=store_key, Body=f.read())
+        return [obj['Key'] for obj in new_objects]
+
+    @staticmethod
+    def sort(table):
+        import pyarrow.compute as pc
+        table = table.filter(pc.is_valid(table['rate']))
+        return table.sort_by([('currency', 'ascending'), ('valid_from', 'ascending')])
+
+    def save(self):
+        # Compact binary copy, currency and key repeat a lot and are stored dictionary encoded
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([('currency', pa.dictionary(pa.int32(), pa.string())), ('valid_from', pa.timestamp('us')),
+                            ('rate', pa.float64()), ('source_key', pa.dictionary(pa.int32(), pa.string()))])
+        tmp_path = self.path + '.tmp'
+        pq.write_table(self.table.cast(schema), tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, currencies, at):
+        """
+        Finds the rate valid at the given time for every currency, NaN if none was known yet.
+
+        :param currencies: Series of currency codes.
+        :param at: One time for all rows, or a Series of times aligned with currencies.
+        :return: DataFrame with rate and source_key, aligned with currencies.
+        """
+        import pandas as pd
+        times = at if isinstance(at, pd.Series) else pd.Series(pd.Timestamp(at), index=currencies.index)
+        left = pd.DataFrame({
+            'currency': currencies.to_numpy(),
+            'valid_from': times.astype('datetime64[ns]').to_numpy(),
+            'position': range(len(currencies)),
+        }).astype({'currency': str}).sort_values('valid_from', kind='stable')
+        right = self.rates.astype({'currency': str, 'valid_from': 'datetime64[ns]'}).sort_values('valid_from',
+                                                                                             kind='stable')
+        merged = pd.merge_asof(left, right, on='valid_from', by='currency', direction='backward')
+        merged = merged.sort_values('position')
+        return pd.DataFrame({'rate': merged['rate'].to_numpy(), 'source_key': merged['source_key'].to_numpy()},
+                            index=currencies.index)
+
+    def lookup_rows(self, currencies, at):
+        """
+        Pandas-free lookup for a few rows: binary search in per-currency lists.
+
+        :param currencies: Currency codes.
+        :param at: One naive UTC datetime for all rows.
+        :return: (rate, source_key) per currency, (None, None) if no rate was known yet.
+        """
+        if self._index is None:
+            # valid_from as integer microseconds, converting timestamps to Python would import pandas
+            import pyarrow as pa
+            columns = self.table.select(COLUMNS)
+            times = columns.column('valid_from').cast(pa.int64()).to_pylist()
+            self._index = {}
+            for currency, valid_from, rate, source_key in zip(columns.column('currency').to_pylist(), times,
+                                                              columns.column('rate').to_pylist(),
+                                                              columns.column('source_key').to_pylist()):
+                entry = self._index.setdefault(currency, ([], []))
+                entry[0].append(valid_from)
+                entry[1].append((rate, source_key))
+
+        at_us = round((at - datetime(1970, 1, 1)).total_seconds() * 1_000_000)
+        result = []
+        for currency in currencies:
+            times, values = self._index.get(currency, ((), ()))
+            position = bisect.bisect_right(times, at_us)
+            result.append(values[position - 1] if position else (None, None))
+        return result
+
+# Kept for warm invocations
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = RateStore()
+    return _store
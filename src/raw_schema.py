@@ -0,0 +1,73 @@
+"""
+@file: raw_schema.py
+@date: 18/10/2026
+
+Typed Parquet output for the raw layer of the data lake.
+
+Both producers (commodity snapshots and the nutrition table) write their frames with an explicit
+schema: numbers as float64, repeating labels (category, currency, unit) dictionary encoded.
+"""
+
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+COMPRESSION = 'zstd'
+
+COMMODITY_SCHEMA = pa.schema([
+    ('category', pa.dictionary(pa.int32(), pa.string())),
+    ('name', pa.string()),
+    ('price', pa.float64()),
+    ('currency', pa.dictionary(pa.int32(), pa.string())),
+    ('unit', pa.dictionary(pa.int32(), pa.string())),
+])
+
+NUTRITION_FIELDS = ['kcal', 'kJoule', 'water', 'protein', 'carbohydrat', 'sugars', 'fat', 'saturated_fat',
+                    'monounsat', 'polyunsat', 'cholesterol', 'dietary_fiber', 'emotional_value', 'health_value']
+
+NUTRITION_SCHEMA = pa.schema([('Product Name', pa.string())] + [(field, pa.float64()) for field in NUTRITION_FIELDS])
+
+
+def to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """
+    Converts a DataFrame to an Arrow table with the given schema.
+
+    Numeric columns that still hold strings are parsed first, decimal commas are accepted and
+    values that are not numbers become null.
+
+    :param df: The DataFrame, must contain all schema columns.
+    :param schema: The target schema.
+    :return: The typed Arrow table.
+    """
+    columns = {}
+    for field in schema:
+        column = df[field.name]
+        if pa.types.is_floating(field.type) and not pd.api.types.is_numeric_dtype(column):
+            column = pd.to_numeric(column.astype('string').str.replace(',', '.', regex=False), errors='coerce')
+        columns[field.name] = column
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+
+
+def to_parquet_bytes(df: pd.DataFrame, schema: pa.Schema) -> bytes:
+    """
+    Serializes a DataFrame as compressed Parquet with the given schema, e.g. for an S3 upload.
+    """
+    buffer = io.BytesIO()
+    pq.write_table(to_table(df, schema), buffer, compression=COMPRESSION)
+    return buffer.getvalue()
+
+
+def write_parquet(df: pd.DataFrame, schema: pa.Schema, path: str) -> None:
+    """
+    Writes a DataFrame as compressed Parquet file with the given schema.
+    """
+    pq.write_table(to_table(df, schema), path, compression=COMPRESSION)
+
+
+def parquet_writer(path: str, schema: pa.Schema) -> pq.ParquetWriter:
+    """
+    Opens a Parquet file for appending tables chunk by chunk, e.g. one per scraped letter.
+    """
+    return pq.ParquetWriter(path, schema, compression=COMPRESSION)
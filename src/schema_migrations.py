@@ -0,0 +1,306 @@
+"""
+@file: schema_migrations.py
+@date: 18/10/2026
+
+Versioned, non-destructive schema migrations for the lakecrusher warehouse.
+
+Every migration runs once, its version is recorded in schema_migrations. MySQL commits DDL
+implicitly, so each step also checks the current schema before changing it: a migration that was
+interrupted halfway can simply be run again. Existing data always stays in place.
+"""
+
+from datetime import date
+
+# Months of empty partitions kept ahead of today, so new snapshots never land in pmax
+FUTURE_PARTITION_MONTHS = 3
+
+
+def column_type(cursor, table, column):
+    cursor.execute(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row[0].lower() if row else None
+
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+        (table, index)
+    )
+    return cursor.fetchone() is not None
+
+
+def foreign_key_exists(cursor, table, constraint):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.TABLE_CONSTRAINTS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = %s "
+        "AND CONSTRAINT_TYPE = 'FOREIGN KEY'",
+        (table, constraint)
+    )
+    return cursor.fetchone() is not None
+
+
+def partition_names(cursor, table):
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (table,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def month_start(day, months_ahead=0):
+    month_index = day.year * 12 + day.month - 1 + months_ahead
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_definition(month):
+    # p202505 holds May 2025: everything before 1 June 2025
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{month_start(month, 1):%Y-%m-%d}')"
+
+
+def create_baseline_tables(cursor):
+    # The schema CommodityTableCreator used to drop and recreate on every run
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS commodity_prices_usd (
+            category VARCHAR(100),
+            trading_goods_name VARCHAR(100),
+            price FLOAT,
+            currency VARCHAR(10),
+            unit VARCHAR(50),
+            converted_usd_price FLOAT,
+            timestamp CHAR(8),
+            PRIMARY KEY (trading_goods_name, timestamp)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nutrition_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            trading_goods_name VARCHAR(100),
+            product_name VARCHAR(100),
+            kcal INT,
+            kJoule INT,
+            water DECIMAL(5,1),
+            protein DECIMAL(5,1),
+            carbohydrate DECIMAL(5,1),
+            sugars DECIMAL(5,1),
+            fat DECIMAL(5,1),
+            saturated_fat DECIMAL(5,1),
+            monounsat DECIMAL(5,1),
+            polyunsat DECIMAL(5,1),
+            cholesterol DECIMAL(5,1),
+            dietary_fiber DECIMAL(5,1),
+            emotional_value DECIMAL(5,1),
+            health_value DECIMAL(5,1),
+            timestamp CHAR(8),
+            CONSTRAINT fk_trading_goods
+                FOREIGN KEY (trading_goods_name, timestamp)
+                REFERENCES commodity_prices_usd(trading_goods_name, timestamp)
+        );
+    """)
+
+
+def add_row_hash(cursor):
+    if column_type(cursor, 'commodity_prices_usd', 'row_hash') is None:
+        cursor.execute("ALTER TABLE commodity_prices_usd ADD COLUMN row_hash CHAR(16)")
+
+
+def create_trading_goods(cursor):
+    # The goods vocabulary gets its own table instead of placeholder price rows without a date
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trading_goods (
+            name VARCHAR(100) PRIMARY KEY
+        );
+    """)
+    cursor.execute("""
+        INSERT IGNORE INTO trading_goods (name)
+        SELECT DISTINCT trading_goods_name FROM commodity_prices_usd WHERE trading_goods_name IS NOT NULL
+    """)
+    if foreign_key_exists(cursor, 'nutrition_data', 'fk_trading_goods'):
+        cursor.execute("""
+            DELETE c FROM commodity_prices_usd c
+            LEFT JOIN nutrition_data n
+                ON n.trading_goods_name = c.trading_goods_name AND n.timestamp = c.timestamp
+            WHERE (c.timestamp IS NULL OR c.timestamp = '') AND c.price IS NULL AND n.id IS NULL
+        """)
+    else:
+        cursor.execute("""
+            DELETE FROM commodity_prices_usd
+            WHERE (timestamp IS NULL OR timestamp = '') AND price IS NULL
+        """)
+
+
+def convert_timestamp_to_date(cursor):
+    # Partitioned InnoDB tables cannot take part in foreign keys, the link becomes a plain index
+    if foreign_key_exists(cursor, 'nutrition_data', 'fk_trading_goods'):
+        cursor.execute("ALTER TABLE nutrition_data DROP FOREIGN KEY fk_trading_goods")
+    if not index_exists(cursor, 'nutrition_data', 'idx_nd_trading_goods'):
+        cursor.execute("CREATE INDEX idx_nd_trading_goods ON nutrition_data (trading_goods_name, timestamp)")
+
+    # 'YYYYMMDD' strings convert to DATE in place
+    if column_type(cursor, 'commodity_prices_usd', 'timestamp') != 'date':
+        cursor.execute("ALTER TABLE commodity_prices_usd MODIFY timestamp DATE NOT NULL")
+    if column_type(cursor, 'nutrition_data', 'timestamp') != 'date':
+        cursor.execute("UPDATE nutrition_data SET timestamp = NULL WHERE timestamp = ''")
+        cursor.execute("ALTER TABLE nutrition_data MODIFY timestamp DATE NULL")
+
+
+def add_analytic_indexes(cursor):
+    # Per-commodity queries use the primary key (trading_goods_name, timestamp)
+    if not index_exists(cursor, 'commodity_prices_usd', 'idx_cp_timestamp'):
+        cursor.execute("CREATE INDEX idx_cp_timestamp ON commodity_prices_usd (timestamp)")
+    if not index_exists(cursor, 'commodity_prices_usd', 'idx_cp_category_timestamp'):
+        cursor.execute("CREATE INDEX idx_cp_category_timestamp ON commodity_prices_usd (category, timestamp)")
+
+
+def partition_by_month(cursor):
+    if partition_names(cursor, 'commodity_prices_usd'):
+        return
+
+    # One partition per month from the oldest snapshot up to the months ahead, the rest goes to pmax
+    cursor.execute("SELECT MIN(timestamp) FROM commodity_prices_usd")
+    oldest = cursor.fetchone()[0] or date.today()
+    first, last = month_start(oldest), month_start(date.today(), FUTURE_PARTITION_MONTHS)
+    months = []
+    while first <= last:
+        months.append(first)
+        first = month_start(first, 1)
+
+    definitions = [partition_definition(month) for month in months]
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(f"ALTER TABLE commodity_prices_usd PARTITION BY RANGE COLUMNS(timestamp) ({', '.join(definitions)})")
+
+
+def create_loaded_files(cursor):
+    # One row per raw file loaded by the backfill, reruns skip files whose ETag is unchanged
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS loaded_files (
+            file_key VARCHAR(255) PRIMARY KEY,
+            etag VARCHAR(64),
+            row_count INT,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def create_price_aggregates(cursor):
+    # Unit conversion per good and traded unit, average nutrition per good and the daily prices
+    # derived from both; aggregates.py keeps them up to date
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS unit_conversions (
+            trading_goods_name VARCHAR(100),
+            unit VARCHAR(50),
+            base_unit VARCHAR(5),
+            base_units_per_unit DOUBLE,
+            kg_per_unit DOUBLE,
+            PRIMARY KEY (trading_goods_name, unit)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS good_nutrition (
+            trading_goods_name VARCHAR(100) PRIMARY KEY,
+            products INT,
+            kcal_per_100g DOUBLE,
+            protein_per_100g DOUBLE
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_good_prices (
+            trading_goods_name VARCHAR(100),
+            timestamp DATE,
+            converted_usd_price DOUBLE,
+            unit VARCHAR(50),
+            base_unit VARCHAR(5),
+            usd_per_base_unit DOUBLE,
+            usd_per_1000_kcal DOUBLE,
+            usd_per_g_protein DOUBLE,
+            avg_7d_usd_per_base_unit DOUBLE,
+            avg_30d_usd_per_base_unit DOUBLE,
+            avg_7d_usd_per_1000_kcal DOUBLE,
+            avg_30d_usd_per_1000_kcal DOUBLE,
+            avg_7d_usd_per_g_protein DOUBLE,
+            avg_30d_usd_per_g_protein DOUBLE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (trading_goods_name, timestamp)
+        );
+    """)
+    if not index_exists(cursor, 'daily_good_prices', 'idx_dgp_timestamp'):
+        cursor.execute("CREATE INDEX idx_dgp_timestamp ON daily_good_prices (timestamp)")
+
+
+MIGRATIONS = [
+    (1, "baseline tables", create_baseline_tables),
+    (2, "row hash for upserts", add_row_hash),
+    (3, "trading goods dimension", create_trading_goods),
+    (4, "DATE snapshot column", convert_timestamp_to_date),
+    (5, "indexes on date and category", add_analytic_indexes),
+    (6, "monthly range partitions", partition_by_month),
+    (7, "backfill checkpoints", create_loaded_files),
+    (8, "daily price aggregates", create_price_aggregates),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(200),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(connection):
+    """
+    Applies all migrations that have not run yet, in version order.
+
+    :param connection: Open pymysql connection.
+    :return: The versions applied by this call.
+    """
+    applied = []
+    with connection.cursor() as cursor:
+        done = applied_versions(cursor)
+        for version, description, migration in MIGRATIONS:
+            if version in done:
+                continue
+            migration(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            connection.commit()
+            applied.append(version)
+    return applied
+
+
+def ensure_future_partitions(connection, months_ahead=FUTURE_PARTITION_MONTHS):
+    """
+    Splits pmax so that monthly partitions exist up to `months_ahead` months from today.
+
+    :param connection: Open pymysql connection.
+    :param months_ahead: Number of months after the current one that need their own partition.
+    :return: The names of the partitions added.
+    """
+    with connection.cursor() as cursor:
+        existing = [name for name in partition_names(cursor, 'commodity_prices_usd') if name != 'pmax']
+        if not existing:
+            return []
+
+        last = date(int(existing[-1][1:5]), int(existing[-1][5:7]), 1)
+        target = month_start(date.today(), months_ahead)
+        months = []
+        while month_start(last, 1) <= target:
+            last = month_start(last, 1)
+            months.append(last)
+        if not months:
+            return []
+
+        definitions = [partition_definition(month) for month in months]
+        definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE commodity_prices_usd REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+        return [f"p{month:%Y%m}" for month in months]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules live flat in src/, as on Lambda
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pandas as pd
+
+import backfill
+
+
+def snapshot_frame(price):
+    return pd.DataFrame({'category': ['Agricultural'], 'trading_goods_name': ['Wheat'], 'price': [price],
+                         'currency': ['USD'], 'unit': ['t'], 'converted_usd_price': [price],
+                         'timestamp': ['20250512']})
+
+
+class TableCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement, params=None):
+        self.result = [key + (row[-1],) for key, row in self.connection.table.items()]
+
+    def executemany(self, statement, rows):
+        for row in rows:
+            self.connection.table[(row[1], row[6])] = row
+
+    def fetchall(self):
+        return self.result
+
+
+class TableConnection:
+    """Keeps commodity_prices_usd as a dict keyed by (trading_goods_name, timestamp)."""
+
+    def __init__(self):
+        self.table = {}
+
+    def cursor(self):
+        return TableCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_later_snapshot_of_a_day_wins_over_a_slow_earlier_one(monkeypatch):
+    prices = {'commodities_2025-05-12_08-00-00.csv': 100.0, 'commodities_2025-05-12_20-00-00.csv': 120.0}
+
+    def prepare_file(bucket, key):
+        if prices[key] == 100.0:
+            # The earlier snapshot finishes last
+            time.sleep(0.3)
+        return snapshot_frame(prices[key]), 0
+
+    monkeypatch.setattr(backfill, 'prepare_file', prepare_file)
+    monkeypatch.setattr(backfill.aggregates, 'refresh', lambda conn, keys: None)
+    monkeypatch.setattr(backfill, 'mark_loaded', lambda conn, key, etag, row_count: None)
+
+    conn = TableConnection()
+    totals = {'files': 0, 'rows': 0, 'failed_rows': 0, 'unconvertible': 0, 'failed_files': []}
+    results = queue.Queue(maxsize=1)
+    writer = threading.Thread(target=backfill.write_results, args=(conn, results, backfill.STRATEGY, totals))
+    writer.start()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        backfill.convert_files(pool, [(key, 'etag') for key in prices], 2, results, totals)
+    results.put(None)
+    writer.join()
+
+    assert (totals['files'], totals['failed_files']) == (2, [])
+    assert conn.table[('Wheat', '20250512')][2] == 120.0
+
+
+def test_failed_file_does_not_hold_back_the_later_ones(monkeypatch):
+    def prepare_file(bucket, key):
+        if key == 'broken.csv':
+            raise ValueError("no price column")
+        return snapshot_frame(1.0), 0
+
+    monkeypatch.setattr(backfill, 'prepare_file', prepare_file)
+    totals = {'unconvertible': 0, 'failed_files': []}
+    results = queue.Queue()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        backfill.convert_files(pool, [('a.csv', 1), ('broken.csv', 2), ('c.csv', 3)], 1, results, totals)
+
+    assert [results.get()[0] for _ in range(results.qsize())] == ['a.csv', 'c.csv']
+    assert totals['failed_files'] == ["broken.csv: no price column"]
+
+
+class ListingClient:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket):
+        return [{'Contents': [{'Key': key, 'ETag': etag, 'LastModified': None} for key, etag in self.keys]}]
+
+
+def test_snapshots_are_listed_in_snapshot_time_order():
+    client = ListingClient([('b/commodities_2025-05-12_20-00-00.csv', 'e1'),
+                            ('a/commodities_2025-05-12_08-00-00.csv', 'e2'),
+                            ('a/commodities_2025-05-13.csv', 'e3')])
+    assert backfill.list_snapshots(client, 'bucket', end=date(2025, 5, 12)) == [
+        (date(2025, 5, 12), 'a/commodities_2025-05-12_08-00-00.csv', 'e2'),
+        (date(2025, 5, 12), 'b/commodities_2025-05-12_20-00-00.csv', 'e1'),
+    ]
+
+
+def test_rerun_reloads_the_later_snapshots_of_a_changed_day():
+    snapshots = [(date(2025, 5, 12), 'morning.csv', 'new'), (date(2025, 5, 12), 'evening.csv', 'e2'),
+                 (date(2025, 5, 13), 'next_day.csv', 'e3')]
+    done = {'morning.csv': 'old', 'evening.csv': 'e2', 'next_day.csv': 'e3'}
+    assert backfill.files_to_load(snapshots, done) == [('morning.csv', 'new'), ('evening.csv', 'e2')]
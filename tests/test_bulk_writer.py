@@ -0,0 +1,204 @@
+import csv
+import os
+
+import pandas as pd
+import pymysql
+import pytest
+
+import bulk_writer
+import connections
+
+
+def make_row(name, price=10.0, currency='EUR', timestamp='20250512'):
+    row = ('Agricultural', name, price, currency, 't', None if price is None else price * 2, timestamp)
+    return row + (bulk_writer.row_hash(row),)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, statement, params=None):
+        if statement.lstrip().startswith('SELECT'):
+            self.result = [(name, timestamp, row_hash) for (name, timestamp), row_hash in self.connection.stored.items()]
+            return
+        self.connection.before_write()
+        if 'LOAD DATA' in statement:
+            # The file is removed after the call, read it while it exists
+            with open(params[0], encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+            self.connection.written.append(rows)
+            self.rowcount = len(rows)
+        else:
+            self.connection.written.append([params])
+
+    def executemany(self, statement, rows):
+        self.connection.before_write()
+        self.connection.written.append(list(rows))
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    """Records every write call; the write calls listed in fail_on raise like a duplicate key would."""
+
+    def __init__(self, fail_on=(), stored=None):
+        self.fail_on = set(fail_on)
+        self.stored = stored or {}
+        self.written = []
+        self.write_calls = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def before_write(self):
+        self.write_calls += 1
+        if self.write_calls in self.fail_on:
+            raise pymysql.err.IntegrityError(1062, "Duplicate entry")
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.mark.parametrize('strategy', ['executemany', 'load_data', 'upsert'])
+def test_write_rows_batches(strategy):
+    conn = FakeConnection()
+    rows = [make_row(f'good{idx}') for idx in range(5)]
+
+    summary = bulk_writer.write_rows(conn, rows, strategy=strategy, batch_size=2)
+
+    assert (summary['batches'], summary['written'], summary['failed']) == (3, 5, 0)
+    assert [len(batch) for batch in conn.written] == [2, 2, 1]
+    assert conn.commits == 3
+
+
+def test_write_rows_row_strategy_sends_one_statement_per_row():
+    conn = FakeConnection()
+    summary = bulk_writer.write_rows(conn, [make_row('Wheat'), make_row('Corn')], strategy='row', batch_size=10)
+    assert summary['written'] == 2
+    assert len(conn.written) == 2
+
+
+def test_failing_batch_is_rolled_back_and_counted():
+    conn = FakeConnection(fail_on={2})
+    rows = [make_row(f'good{idx}') for idx in range(5)]
+
+    summary = bulk_writer.write_rows(conn, rows, strategy='executemany', batch_size=2)
+
+    assert (summary['written'], summary['failed']) == (3, 2)
+    assert len(summary['errors']) == 1
+    assert (conn.commits, conn.rollbacks) == (2, 1)
+
+
+def test_none_is_written_as_null():
+    rows = [make_row('Milk', price=None, currency=None)]
+
+    conn = FakeConnection()
+    bulk_writer.write_rows(conn, rows, strategy='executemany')
+    assert conn.written[0][0][2:6] == (None, None, 't', None)
+
+    # LOAD DATA reads \N as NULL, an empty field would become '' or 0
+    conn = FakeConnection()
+    bulk_writer.write_rows(conn, rows, strategy='load_data')
+    assert conn.written[0][0][2:6] == ['\\N', '\\N', 't', '\\N']
+
+
+def test_frame_rows_get_none_and_the_tuple_hash():
+    df = pd.DataFrame({'category': ['Agricultural'], 'trading_goods_name': ['Milk'], 'price': [float('nan')],
+                       'currency': [None], 'unit': ['t'], 'converted_usd_price': [float('nan')],
+                       'timestamp': ['20250512']})
+    conn = FakeConnection()
+    bulk_writer.write_rows(conn, df, strategy='executemany')
+    assert conn.written[0] == [make_row('Milk', price=None, currency=None)]
+
+
+def test_upsert_counts_inserted_updated_and_skipped():
+    unchanged, changed, new = make_row('Wheat'), make_row('Corn', price=12.0), make_row('Rice')
+    stored = {('Wheat', '20250512'): unchanged[-1], ('Corn', '20250512'): make_row('Corn')[-1]}
+    conn = FakeConnection(stored=stored)
+
+    summary = bulk_writer.write_rows(conn, [unchanged, changed, new], strategy='upsert')
+
+    assert {name: summary[name] for name in ('inserted', 'updated', 'skipped', 'written', 'failed')} == \
+        {'inserted': 1, 'updated': 1, 'skipped': 1, 'written': 2, 'failed': 0}
+    assert conn.written == [[changed, new]]
+
+
+def test_upsert_rewrites_rows_stored_without_hash():
+    row = make_row('Wheat')
+    conn = FakeConnection(stored={('Wheat', '20250512'): None})
+    summary = bulk_writer.write_rows(conn, [row], strategy='upsert')
+    assert (summary['updated'], summary['skipped']) == (1, 0)
+
+
+# Against a real MySQL/MariaDB, e.g. DB_HOST=127.0.0.1 DB_USER=... DB_PASS=... with a lakecrusher database.
+# The temporary table hides the real commodity_prices_usd for this session only.
+@pytest.fixture
+def mysql_conn():
+    if not os.environ.get('DB_HOST'):
+        pytest.skip("DB_HOST not set")
+    conn = connections.get_connection(connect_timeout=5, local_infile=True)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMPORARY TABLE commodity_prices_usd (
+                category VARCHAR(100),
+                trading_goods_name VARCHAR(100),
+                price FLOAT,
+                currency VARCHAR(10),
+                unit VARCHAR(50),
+                converted_usd_price FLOAT,
+                timestamp DATE NOT NULL,
+                row_hash CHAR(16),
+                PRIMARY KEY (trading_goods_name, timestamp)
+            )
+        """)
+    yield conn
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TEMPORARY TABLE commodity_prices_usd")
+    connections.close_connection()
+
+
+def stored_rows(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT trading_goods_name, price, currency FROM commodity_prices_usd "
+                       "ORDER BY trading_goods_name")
+        return list(cursor.fetchall())
+
+
+@pytest.mark.parametrize('strategy', bulk_writer.STRATEGIES)
+def test_mysql_write_rows(mysql_conn, strategy):
+    rows = [make_row('Corn'), make_row('Milk', price=None, currency=None), make_row('Wheat')]
+
+    summary = bulk_writer.write_rows(mysql_conn, rows, strategy=strategy, batch_size=2)
+
+    assert (summary['written'], summary['failed']) == (3, 0)
+    assert stored_rows(mysql_conn) == [('Corn', 10.0, 'EUR'), ('Milk', None, None), ('Wheat', 10.0, 'EUR')]
+
+
+def test_mysql_duplicate_batch_is_rolled_back(mysql_conn):
+    bulk_writer.write_rows(mysql_conn, [make_row('Corn')], strategy='executemany')
+    summary = bulk_writer.write_rows(mysql_conn, [make_row('Wheat'), make_row('Corn')], strategy='executemany')
+    assert (summary['written'], summary['failed']) == (0, 2)
+    assert stored_rows(mysql_conn) == [('Corn', 10.0, 'EUR')]
+
+
+def test_mysql_upsert_rerun(mysql_conn):
+    bulk_writer.write_rows(mysql_conn, [make_row('Corn'), make_row('Wheat')], strategy='upsert')
+    summary = bulk_writer.write_rows(mysql_conn, [make_row('Corn'), make_row('Wheat', price=12.0), make_row('Rice')],
+                                     strategy='upsert')
+    assert (summary['inserted'], summary['updated'], summary['skipped']) == (1, 1, 1)
+    assert stored_rows(mysql_conn)[-1] == ('Wheat', 12.0, 'EUR')
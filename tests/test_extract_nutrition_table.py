@@ -0,0 +1,33 @@
+import math
+
+import pandas as pd
+import pytest
+
+import Extract_NutritionTable
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('12', 12.0),
+    ('1,5', 1.5),
+    ('.5', 0.5),
+    (',5', 0.5),
+    ('-.5', -0.5),
+    ('<0,1', 0.1),
+    ('~ 3.2 g', 3.2),
+    ('1.234,5', 1234.5),
+    ('1,234.5', 1234.5),
+    ('1 234,5', 1234.5),
+    ('tr', None),
+    ('', None),
+    (None, None),
+])
+def test_parse_numbers(raw, expected):
+    value = Extract_NutritionTable.parse_numbers(pd.Series([raw], dtype=object)).iloc[0]
+    if expected is None:
+        assert math.isnan(value)
+    else:
+        assert value == pytest.approx(expected)
+
+
+def test_parse_numbers_returns_float64():
+    assert Extract_NutritionTable.parse_numbers(pd.Series(['1', None])).dtype == 'float64'
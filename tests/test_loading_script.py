@@ -0,0 +1,67 @@
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import lambda_function_with_units
+import loadingScript_DWH
+import rate_store
+
+COMMODITIES_PAGE = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "http" / "commodities.html"
+SNAPSHOT_KEY = 'commodities_2025-10-17.csv'
+
+
+@pytest.fixture
+def fixture_records():
+    # The scraper's rows of the committed commodities page, e.g. Wheat at 542.50 USd/Bu
+    tables = lambda_function_with_units.parse_commodity_tables(COMMODITIES_PAGE.read_text())
+    return [dict(record) for records in tables.values() for record in records]
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Currency units per USD, valid before the snapshot
+    valid_from = datetime(2025, 10, 1)
+    store = rate_store.RateStore(str(tmp_path / "rate_store.parquet"))
+    store.table = rate_store.rows_to_table([(currency, valid_from, rate, 'rates.csv') for currency, rate in
+                                            [('AUD', 1.5), ('EUR', 0.8), ('MYR', 4.2), ('CAD', 1.4), ('INR', 88.0),
+                                             ('BRL', 5.4), ('CNY', 7.1), ('NOK', 10.0)]])
+    return store
+
+
+def by_name(rows):
+    return {row[1]: row for row in rows}
+
+
+@pytest.mark.parametrize('raw, expected', [('USd', ('USD', 100.0)), ('AUd', ('AUD', 100.0)), ('GBp', ('GBP', 100.0)),
+                                           ('USD', ('USD', 1.0)), (' eur ', ('EUR', 1.0)), (None, (None, 1.0))])
+def test_clean_currency_value(raw, expected):
+    assert loadingScript_DWH.clean_currency_value(raw) == expected
+
+
+def test_minor_unit_quotes_are_converted_in_the_major_unit(fixture_records, store):
+    rows, unconvertible, _ = loadingScript_DWH.prepare_records(fixture_records, SNAPSHOT_KEY, store)
+    rows = by_name(rows)
+
+    assert unconvertible == 0
+    # 542.50 US cents per bushel
+    assert rows['Wheat'][2:6] == (pytest.approx(5.425), 'USD', 'Bu', pytest.approx(5.425))
+    # 1,182 Australian cents per 100 kg
+    assert rows['Wool'][2:6] == (pytest.approx(11.82), 'AUD', '100Kg', pytest.approx(11.82 / 1.5))
+    # Major units are unchanged
+    assert rows['Cheese'][2:6] == (1.734, 'USD', 'Lbs', 1.734)
+    assert rows['Rapeseed'][2:6] == (483.25, 'EUR', 'T', pytest.approx(483.25 / 0.8))
+
+
+def test_pandas_path_matches_the_fast_path(fixture_records, store):
+    rows, _, _ = loadingScript_DWH.prepare_records(fixture_records, SNAPSHOT_KEY, store)
+
+    df = pd.DataFrame(fixture_records)[loadingScript_DWH.COMMODITY_COLUMNS]
+    df, unconvertible, _ = loadingScript_DWH.prepare_commodities(df, SNAPSHOT_KEY, store)
+
+    assert unconvertible == 0
+    frame_rows = by_name(loadingScript_DWH.bulk_writer.frame_to_rows(df))
+    for name, row in by_name(rows).items():
+        assert frame_rows[name][3] == row[3]
+        assert (frame_rows[name][2], frame_rows[name][5]) == pytest.approx((row[2], row[5]))
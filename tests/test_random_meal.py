@@ -0,0 +1,100 @@
+import json
+from pathlib import Path
+from urllib.parse import urlencode
+
+import pytest
+import requests
+
+import RandomMeal
+from http_cache import CachedResponse, CacheMiss, HttpCache
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures" / "themealdb"
+
+
+def search_url(letter):
+    return RandomMeal.SEARCH_BY_LETTER_URL + "?" + urlencode({"f": letter})
+
+
+def seed(cache_dir, letter, payload):
+    # Stores a search.php response in the cache the way a real fetch would
+    response = CachedResponse(search_url(letter), 200, json.dumps(payload).encode(),
+                              {"Content-Type": "application/json"}, from_cache=False)
+    HttpCache(cache_dir=str(cache_dir), offline=True).store(search_url(letter), response)
+
+
+def load_fixture(letter):
+    return json.loads((FIXTURE_DIR / f"search_{letter}.json").read_text(encoding="utf-8"))
+
+
+@pytest.fixture
+def offline_cache(tmp_path, monkeypatch):
+    # Letters without a seeded response are cache misses, get_all_meals treats them as empty
+    monkeypatch.setenv("HTTP_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("HTTP_CACHE_OFFLINE", "1")
+    seed(tmp_path, "a", load_fixture("a"))
+    seed(tmp_path, "b", load_fixture("b"))
+    return tmp_path
+
+
+def test_get_all_meals_merges_letters_in_order(offline_cache):
+    meals = RandomMeal.get_all_meals(concurrency=4)
+    assert meals["idMeal"].tolist() == ["53049", "52768", "52767", "52874"]
+
+
+def test_get_all_meals_keeps_first_meal_per_id(offline_cache):
+    # A later letter repeating a meal id must not replace the meal already collected
+    repeated = dict(load_fixture("a")["meals"][1], strMeal="Apple Frangipan Tart (repeated)")
+    seed(offline_cache, "z", {"meals": [repeated]})
+
+    meals = RandomMeal.get_all_meals(concurrency=4)
+    assert meals["idMeal"].tolist() == ["53049", "52768", "52767", "52874"]
+    assert meals.set_index("idMeal").loc["52768", "Meal"] == "Apple Frangipan Tart"
+
+
+def test_get_all_meals_renames_columns(offline_cache):
+    meals = RandomMeal.get_all_meals(concurrency=4)
+    assert {"idMeal", "Meal", "Category", "Area", "Ingredient1", "Measure20", "dateModified"} <= set(meals.columns)
+    assert not [column for column in meals.columns if column.startswith("str")]
+
+
+def test_get_meal_ingredients_drops_blank_slots(offline_cache):
+    ingredients = RandomMeal.get_meal_ingredients(RandomMeal.get_all_meals(concurrency=4))
+
+    # The fixtures use "", None and " " for empty slots
+    assert ingredients.groupby("idMeal").size().to_dict() == {"52767": 10, "52768": 9, "52874": 15, "53049": 9}
+    assert ingredients["Ingredient"].str.strip().ne("").all()
+    first = ingredients[ingredients["idMeal"] == "52874"].iloc[0]
+    assert (first["position"], first["Ingredient"], first["Measure"]) == (1, "Beef", "1kg")
+
+
+class RandomMealSession(requests.Session):
+    """Serves the fixture meals one after the other from random.php."""
+
+    def __init__(self, meals):
+        super().__init__()
+        self.meals = meals
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"meals": [self.meals[self.calls % len(self.meals)]]}).encode()
+        self.calls += 1
+        return response
+
+
+def test_random_meals_are_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setenv("HTTP_CACHE_DIR", str(tmp_path))
+    session = RandomMealSession(load_fixture("a")["meals"] + load_fixture("b")["meals"])
+    monkeypatch.setattr(RandomMeal, "create_session", lambda pool_size: session)
+
+    meals = RandomMeal.get_unique_meals(n=12, concurrency=2, window=50)
+
+    assert session.calls == 12
+    assert sorted(meals["idMeal"]) == ["52767", "52768", "52874", "53049"]
+    assert not list((tmp_path / "blobs").iterdir()) and not list((tmp_path / "index").iterdir())
+
+
+def test_random_meals_fail_in_offline_mode(offline_cache):
+    with pytest.raises(CacheMiss):
+        RandomMeal.get_unique_meals(n=5, concurrency=2)